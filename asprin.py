@@ -4,13 +4,81 @@ import os
 import re
 import logging
 #logging.basicConfig(level=logging.DEBUG)
+import time
+_start_time = time.time()
 
 from src.spec_parser import spec_parser
 from src.pp_parser   import   pp_parser
 from src.solver      import      solver
+from src.solver      import    parallel
 
 _version = "asprin version 3.0.0"
 
+_usage = """Usage: asprin [number_of_models] [options] [files]
+Options:
+  --inject=<mode>      Inject models with <mode> (backend or callback)
+  --ground-once        Ground the preference program only once
+  --slots=<k>          Ground the preference program once for each of <k> model slots
+                       (implies --ground-once)
+  --compaction=<n>     Restart with a fresh control after an optimal model
+                       if the ground program has more than <n> atoms
+  --time-limit=<t>     Stop after <t> seconds and report the best model found
+  --solve-limit=<t>    Stop if a single solve call takes more than <t> seconds
+  --method=<m>         Use method <m>:
+                         auto     : minimize if possible, otherwise basic
+                         basic    : improve models iteratively (default)
+                         minimize : translate the preferences into #minimize statements
+                         core     : minimize a subset or superset statement with assumptions
+                                    (one solve call per formula, not core-guided)
+  --heuristic          Decide first on the formulas of the preference statements,
+                       with the sign that makes them better (compare the Steps
+                       in the summary with and without it)
+  --threads=<n>        Solve each step with a portfolio of <n> clasp threads
+                       (--parallel-mode=<n>,compete --configuration=many)
+  --processes=<n>      Enumerate the optimal models with <n> worker processes,
+                       splitting the search space into cubes on the preference atoms
+  --portfolio=<n>      Run <n> worker processes with different methods and configurations,
+                       and report the first that finds an optimum or proves unsatisfiability
+                       (or merge their models if none of them does)
+  --parser-processes=<n>
+                       Parse the files with preference statements with <n> processes
+  --library=<file>     Input file with the library of preference types, whose types are only
+                       loaded if they are used (default: asprin.lib next to asprin.py)
+  --no-cache           Do not read or write the cache of parsed preference specifications
+                       and transformed preference programs
+  --trace-parser       Print the tokens and the actions of the preference specification parser
+Other options starting with '-' are passed to clingo (e.g., --configuration=crafty)"""
+
+# names of the asprin options, the others starting with '-' are passed to clingo
+_options = ["--help","--inject","--ground-once","--slots","--compaction","--time-limit","--solve-limit",
+            "--method","--heuristic","--threads","--processes","--portfolio","--parser-processes",
+            "--library","--no-cache","--trace-parser"]
+
+# options
+MAX_MODELS     = "max_models"
+INJECT         = "inject"
+GROUND_ONCE    = "ground_once"
+SLOTS          = "slots"
+COMPACTION     = "compaction"
+TIME_LIMIT     = "time_limit"
+SOLVE_LIMIT    = "solve_limit"
+METHOD         = "method"
+UNDERSCORES    = "underscores"
+CORE_STATEMENT = "core_statement"
+CORE_TYPE      = "core_type"
+HEURISTIC      = "heuristic"
+CLINGO_OPTIONS = "clingo_options"
+PROCESSES      = "processes"
+PORTFOLIO      = "portfolio"
+TRACE_PARSER   = "trace_parser"
+PROCESS_START  = "process_start"
+CACHE          = "cache"
+CACHE_HITS     = "cache_hits"
+CACHE_MISSES   = "cache_misses"
+PARSER_PROC    = "parser_processes"
+LIBRARY        = "library"
+SLICED_RULES   = "sliced_rules"
+
 class Asprin:
 
     def __init__(self):
@@ -21,14 +89,47 @@ class Asprin:
 
     def run(self,files,options):
         # specification parsing
-        self.spec_parser = spec_parser.Parser()
+        self.spec_parser = spec_parser.Parser(options[TRACE_PARSER],statements=options[CACHE],
+                                              processes=options[PARSER_PROC],library=options[LIBRARY])
         program          = self.spec_parser.parse_files(files)
         underscores      = self.spec_parser.get_underscores()
+        options[CACHE_HITS], options[CACHE_MISSES] = self.spec_parser.get_cache_statistics()
+        # portfolio
+        if options[PORTFOLIO] > 1:
+            options[UNDERSCORES] = underscores
+            minimize, core = self.spec_parser.get_minimize(), self.spec_parser.get_core()
+            parallel.PortfolioSolver(program,underscores,options,minimize,core).run()
+            return
+        # minimize statements
+        if options[METHOD] in [solver.AUTO,solver.MINIMIZE]:
+            minimize = self.spec_parser.get_minimize()
+            if minimize is not None:
+                program += minimize
+                options[METHOD] = solver.MINIMIZE
+            else:
+                if options[METHOD] == solver.MINIMIZE:
+                    print "The preference specification can not be translated to #minimize statements"
+                options[METHOD] = solver.BASIC
+        # core method
+        if options[METHOD] == solver.CORE:
+            core = self.spec_parser.get_core()
+            if core is not None:
+                options[CORE_STATEMENT], options[CORE_TYPE] = core
+            else:
+                print "The optimized statement is not a subset or superset statement"
+                options[METHOD] = solver.BASIC
+        options[UNDERSCORES] = underscores
         # preference programs parsing
-        self.pp_parser   = pp_parser.Parser(underscores)
+        self.pp_parser   = pp_parser.Parser(underscores,options[CLINGO_OPTIONS],programs=options[CACHE])
         control          = self.pp_parser.parse(program)
+        hits, misses     = self.pp_parser.get_cache_statistics()
+        options[CACHE_HITS], options[CACHE_MISSES] = options[CACHE_HITS] + hits, options[CACHE_MISSES] + misses
+        options[SLICED_RULES] = self.pp_parser.get_sliced()
         # solving
-        _solver          = solver.Solver(control)
+        if options[PROCESSES] > 1:
+            parallel.ParallelSolver(control,program,underscores,options).run()
+            return
+        _solver          = solver.Solver(control,lambda: self.pp_parser.parse(program))
         _solver.set_options(options)
         _solver.run()
 
@@ -36,18 +137,62 @@ def run():
     print _version
     asprin = Asprin()
     # parse input
-    max_models = 1
+    options = dict([(MAX_MODELS,1),(INJECT,solver.BACKEND),(GROUND_ONCE,False),
+                    (SLOTS,1),(COMPACTION,0),(TIME_LIMIT,0),(SOLVE_LIMIT,0),
+                    (METHOD,solver.BASIC),(HEURISTIC,False),
+                    (CLINGO_OPTIONS,[]),(PROCESSES,1),(PORTFOLIO,1),
+                    (TRACE_PARSER,False),(PROCESS_START,_start_time),
+                    (CACHE,True),(PARSER_PROC,1),
+                    (LIBRARY,os.path.join(os.path.dirname(os.path.realpath(__file__)),"asprin.lib"))])
     files = []
     for i in sys.argv[1:]:
         if (re.match(r'^[0-9]+$',i)):
-            max_models = int(i)
+            options[MAX_MODELS] = int(i)
         elif i=="--help":
-            print "Usage: asprin [number_of_models] [files]"
+            print _usage
             return
+        elif i.startswith("--inject="):
+            options[INJECT] = i[len("--inject="):]
+            if options[INJECT] not in [solver.BACKEND,solver.CALLBACK]:
+                print "Invalid injection mode: " + options[INJECT]; return
+        elif i=="--ground-once":
+            options[GROUND_ONCE] = True
+        elif re.match(r'^--slots=[1-9][0-9]*$',i):
+            options[SLOTS] = int(i[len("--slots="):])
+            options[GROUND_ONCE] = True
+        elif re.match(r'^--compaction=[0-9]+$',i):
+            options[COMPACTION] = int(i[len("--compaction="):])
+        elif re.match(r'^--time-limit=[0-9]+(\.[0-9]+)?$',i):
+            options[TIME_LIMIT] = float(i[len("--time-limit="):])
+        elif re.match(r'^--solve-limit=[0-9]+(\.[0-9]+)?$',i):
+            options[SOLVE_LIMIT] = float(i[len("--solve-limit="):])
+        elif i.startswith("--method="):
+            options[METHOD] = i[len("--method="):]
+            if options[METHOD] not in [solver.AUTO,solver.BASIC,solver.MINIMIZE,solver.CORE]:
+                print "Invalid method: " + options[METHOD]; return
+        elif i=="--heuristic":
+            options[HEURISTIC] = True
+        elif re.match(r'^--threads=[1-9][0-9]*$',i):
+            threads = i[len("--threads="):]
+            options[CLINGO_OPTIONS] += ["--parallel-mode=" + threads + ",compete","--configuration=many"]
+        elif re.match(r'^--processes=[1-9][0-9]*$',i):
+            options[PROCESSES] = int(i[len("--processes="):])
+        elif re.match(r'^--portfolio=[1-9][0-9]*$',i):
+            options[PORTFOLIO] = int(i[len("--portfolio="):])
+        elif re.match(r'^--parser-processes=[1-9][0-9]*$',i):
+            options[PARSER_PROC] = int(i[len("--parser-processes="):])
+        elif re.match(r'^--library=.+$',i):
+            options[LIBRARY] = i[len("--library="):]
+        elif i=="--no-cache":
+            options[CACHE] = False
+        elif i=="--trace-parser":
+            options[TRACE_PARSER] = True
+        elif i.split("=")[0] in _options:
+            print "Invalid option: " + i; return
+        elif i.startswith("-"):
+            options[CLINGO_OPTIONS].append(i)
         else: files.append(i)
     if files == []: print "No files"; return
-    MAX_MODELS = "max_models"
-    options = dict([(MAX_MODELS,max_models)])
     print "Reading from " + files[0] + " ..."
     asprin.run(files,options)
 
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+#
+# Benchmark of the transformation of the preference programs
+#
+# Usage: pp_parser.py <input> [<n>] [--root=<dir>]
+#   <input>      library   : the preference programs of asprin.lib
+#                synthetic : a preference program with n rules (default: 100000)
+#   --root=<dir> Use the asprin tree in <dir> (e.g., a git worktree of an older commit)
+#
+# Prints the seconds of ProgramTransformer.add() and get_preference_statements()
+# on the statements parsed by clingo, without the parsing and the grounding.
+#
+
+import sys
+import os
+import time
+
+
+# return a preference program with n rules
+def generate(n):
+    out = ["#program preference(bench).\n"]
+    for i in range(n):
+        if i % 2 == 0:
+            out.append("better(P) :- preference(P,bench), holds(a({0})), not holds'(a({0})).\n".format(i))
+        else:
+            out.append("bench{0}(P,X) :- preference(P,bench), holds'(a(X)), X < {0}, #count {{ Y : holds(b(X,Y)) }} > 1.\n".format(i))
+    return "".join(out)
+
+def main():
+    args = [i for i in sys.argv[1:] if not i.startswith("--")]
+    root = os.path.join(os.path.dirname(os.path.realpath(__file__)),"..")
+    for i in sys.argv[1:]:
+        if i.startswith("--root="): root = i[len("--root="):]
+    if args == [] or args[0] not in ["library","synthetic"]:
+        print open(__file__).read().split("\n\n")[0]
+        sys.exit(1)
+    sys.path.insert(0,os.path.realpath(root))
+    import clingo
+    from src.pp_parser import pp_parser
+    if args[0] == "library": program = open(os.path.join(root,"asprin.lib")).read()
+    else:                    program = generate(int(args[1]) if len(args) > 1 else 100000)
+    statements = []
+    clingo.parse_program(program,statements.append)
+    t = pp_parser.ProgramTransformer("_")
+    start = time.time()
+    for i in statements:
+        t.add(i)
+    t.get_preference_statements()
+    seconds = time.time() - start
+    print "{}\t{} statements\t{:.2f}s".format(args[0],len(statements),seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Benchmark of the preference specification parser
+#
+# Usage: spec_parser.py <input> <n> [--trace] [--write] [--root=<dir>]
+#   <input>      statements : n preference statements with 3 elements each
+#                elements   : one preference statement with n elements
+#   --trace      Parse with Parser(trace=True), printing to /dev/null
+#   --write      Write the translation to /dev/null piece by piece instead of joining it
+#   --root=<dir> Use the asprin tree in <dir> (e.g., a git worktree of an older commit)
+#
+# Prints the seconds of the parse and translation, and the peak memory of the process,
+# and for trees with Parser.__parse_files(), the part of the translation in both.
+# The cache of statements is not used; the parser tables are built before the timing.
+#
+
+import sys
+import os
+import time
+import inspect
+import resource
+import tempfile
+
+
+# return the preference specification of the input
+def generate(input,n):
+    out = ["dom(1..10).\n{ a(X) : dom(X) }.\n{ b(X,Y) : dom(X), dom(Y) }.\n"]
+    if input == "statements":
+        for i in range(n):
+            out.append("#preference(p{0},subset) {{ a({1}); not b({1},X) : dom(X); a(Y) : b(Y,{1}) }}.\n".format(i,i%10+1))
+        out.append("#preference(all,pareto) {{ {} }}.\n".format("; ".join(["**p{}".format(i) for i in range(n)])))
+        out.append("#optimize(all).\n")
+    else:
+        out.append("#preference(p,less_weight) {\n")
+        out.append(";\n".join(["  {0}::a({1}) : b({1},{2})".format(i,i%10+1,i/10%10+1) for i in range(n)]))
+        out.append("\n}.\n#optimize(p).\n")
+    return "".join(out)
+
+# return the peak memory of the process in MB
+def get_memory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# return a Parser with the arguments that the tree supports
+def get_parser(spec_parser,trace):
+    args = inspect.getargspec(spec_parser.Parser.__init__).args
+    kwargs = dict([(k,v) for k, v in [("trace",trace),("statements",False)] if k in args])
+    return spec_parser.Parser(**kwargs)
+
+def main():
+    args = [i for i in sys.argv[1:] if not i.startswith("--")]
+    options = [i for i in sys.argv[1:] if i.startswith("--")]
+    if len(args) != 2 or args[0] not in ["statements","elements"]:
+        print open(__file__).read().split("\n\n")[0]
+        sys.exit(1)
+    input, n = args[0], int(args[1])
+    root = os.path.join(os.path.dirname(os.path.realpath(__file__)),"..")
+    for i in options:
+        if i.startswith("--root="): root = i[len("--root="):]
+    sys.path.insert(0,os.path.realpath(root))
+    from src.spec_parser import spec_parser
+    with tempfile.NamedTemporaryFile(suffix=".lp") as f:
+        f.write(generate(input,n))
+        f.flush()
+        stdout, stderr, devnull = sys.stdout, sys.stderr, open(os.devnull,"w")
+        sys.stdout = sys.stderr = devnull
+        try:
+            parser = get_parser(spec_parser,"--trace" in options)
+            start = time.time()
+            # trees with Parser.__parse_files are timed separately for the parsing and the translation
+            if hasattr(parser,"_Parser__parse_files"):
+                parser._Parser__parse_files([f.name])
+                middle, memory = time.time(), get_memory()
+                if "--write" in options and hasattr(parser,"_Parser__translate_list"):
+                    for i in parser._Parser__translate_list(): devnull.write(i)
+                else:
+                    parser._Parser__print_list()
+            else:
+                parser.parse_files([f.name])
+                middle, memory = None, None
+            end = time.time()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    out = "{} {}\t{:.2f}s".format(input,n,end-start)
+    if middle is not None:
+        out += "\t(parse {:.2f}s, translation {:.2f}s)".format(middle-start,end-middle)
+    out += "\t{}MB".format(get_memory())
+    if memory is not None:
+        out += "\t(translation +{}MB)".format(get_memory()-memory)
+    print out
+
+if __name__ == "__main__":
+    main()
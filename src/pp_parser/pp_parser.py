@@ -1,21 +1,44 @@
 #script (python)
 
+import os
+import hashlib
 import clingo
 import clingo.ast
 import pdb
+from src.spec_parser import cache
 
 modify_conditional_literal    = True
 modify_conditional_literal    = False
 modify_body_aggregate_element = True
 #modify_body_aggregate_element = False
 
+# cache of parsed chunks and of transformed preference programs
+PROGRAMS   = "programs"
+CACHE_SIZE = 256*1024*1024 # bytes
 
+
+# return the md5 of this file and the version of clingo
+def get_sources_hash():
+    source = open(os.path.splitext(os.path.realpath(__file__))[0] + ".py").read()
+    return hashlib.md5(source + clingo.__version__).hexdigest()[:12]
+
+
+#
+# The visit function of every AST type is looked up once per class and stored in its dispatch table:
+#   - visit_<type> if the class has it,
+#   - visit_leaf if the type is in the leaves of the class, whose subtrees are never changed, or
+#   - visit_children otherwise.
+#
 class Transformer:
 
+    # AST types whose subtrees are not changed
+    leaves = set([])
+
     def underscore(self,x):
         return self.__underscore + x
 
     def __init__(self,underscore=""):
+        if "dispatch" not in self.__class__.__dict__: self.__class__.dispatch = {}
         self.__underscore = underscore
         self.m1 = clingo.Function(self.underscore("m1"),[])
         self.m2 = clingo.Function(self.underscore("m2"),[])
@@ -28,13 +51,24 @@ class Transformer:
             setattr(x, key, self.visit(getattr(x, key), *args, **kwargs))
         return x
 
+    def visit_leaf(self, x, *args, **kwargs):
+        return x
+
+    def __add_dispatch(self, type):
+        cls, name = self.__class__, str(type)
+        if   hasattr(cls, "visit_" + name): visit = getattr(cls, "visit_" + name)
+        elif name in cls.leaves:            visit = cls.visit_leaf
+        else:                               visit = cls.visit_children
+        cls.dispatch[type] = visit
+        return visit
+
     def visit(self, x, *args, **kwargs):
         if isinstance(x, clingo.ast.AST):
-            attr = "visit_" + str(x.type)
-            if hasattr(self, attr):
-                return getattr(self, attr)(x, *args, **kwargs)
-            else:
-                return self.visit_children(x, *args, **kwargs)
+            try:
+                visit = self.dispatch[x.type]
+            except KeyError:
+                visit = self.__add_dispatch(x.type)
+            return visit(self, x, *args, **kwargs)
         elif isinstance(x, list):
             return [self.visit(y, *args, **kwargs) for y in x]
         elif x is None:
@@ -45,6 +79,8 @@ class Transformer:
 
 class TermTransformer(Transformer):
 
+    leaves = set(["Variable","BinaryOperation","Interval"])
+
     def __init__(self,underscore=""):
         Transformer.__init__(self,underscore)
 
@@ -61,7 +97,9 @@ class TermTransformer(Transformer):
             term.name = self.underscore(term.name)
             term.arguments.append(clingo.ast.Symbol(term.location,self.m1))
             term.arguments.append(clingo.ast.Symbol(term.location,self.m2))
-        elif term.name not in self.det:
+        elif (term.name,len(term.arguments)) in self.det:
+            term.name = "_" + self.underscore(term.name)
+        else:
             term.name = "_" + self.underscore(term.name)
             term.arguments.append(clingo.ast.Symbol(term.location,self.m1))
             term.arguments.append(clingo.ast.Symbol(term.location,self.m2))
@@ -76,10 +114,186 @@ class TermTransformer(Transformer):
         return term
 
 
+# add to out the signatures (name,arity) of the symbolic atoms in x
+def signatures(x,out):
+    if isinstance(x, clingo.ast.AST):
+        if str(x.type) == "SymbolicAtom": return predicates(x.term,out)
+        for key in x.child_keys:
+            signatures(getattr(x, key), out)
+    elif isinstance(x, list):
+        for y in x: signatures(y, out)
+    return out
+
+def predicates(term,out):
+    if   str(term.type) == "Function":       out.add((term.name,len(term.arguments)))
+    elif str(term.type) == "UnaryOperation": predicates(term.argument,out)
+    elif str(term.type) == "Pool":
+        for x in term.arguments: predicates(x,out)
+    return out
+
+
+#
+# Slicing of the preference programs by the relations that may be required
+#
+# The relations R of the atoms required(P,R) that may be derived are computed
+# from the rules with head required(P,R), starting from those without required/2 in the body
+# (e.g., required(P,better) :- optimize(P)).
+# The rules with a literal required(P,R) in the body, where R is a constant that may not be derived, are removed.
+# Nothing is removed if some rule derives required(P,R) and R is neither a constant
+# nor the relation of a literal required(Q,R) in its body (e.g., required(A,B) :- required(A,B)).
+#
+REQUIRED = "required"
+
+class Slicer:
+
+    def __init__(self):
+        self.removed = 0
+
+    # return the name of a constant term, or None
+    def __constant(self,term):
+        if str(term.type) == "Function" and term.arguments == []: return term.name
+        if (str(term.type) == "Symbol" and term.symbol.type == clingo.SymbolType.Function
+            and term.symbol.arguments == []):
+                return term.symbol.name
+        return None
+
+    # return the relation term of a symbolic atom required/2, or None
+    def __relation(self,atom):
+        if str(atom.type) != "SymbolicAtom" or str(atom.term.type) != "Function": return None
+        if atom.term.name != REQUIRED or len(atom.term.arguments) != 2:     return None
+        return atom.term.arguments[1]
+
+    # return the relation terms of the positive literals required/2 in the body
+    def __body(self,rule):
+        out = []
+        for i in rule.body:
+            if str(i.type) == "Literal" and i.sign == clingo.ast.Sign.None:
+                relation = self.__relation(i.atom)
+                if relation is not None: out.append(relation)
+        return out
+
+    # return the list of pairs (body,head) with the relations of the rules deriving required/2,
+    # where None stands for a relation that is not a constant, or None if nothing can be removed
+    def __edges(self,statements):
+        out = []
+        for i in statements:
+            if str(i.type) != "Rule" or (REQUIRED,2) not in signatures(i.head,set()): continue
+            if str(i.head.type) != "Literal" or str(i.head.atom.type) != "SymbolicAtom": return None
+            head, body = self.__relation(i.head.atom), self.__body(i)
+            if head is None: return None
+            if self.__constant(head) is None:
+                if str(head.type) == "Variable" and head.name in [str(x) for x in body]: continue
+                return None
+            out.append(([self.__constant(x) for x in body],self.__constant(head)))
+        return out
+
+    # return True if all the relations of the body may be required
+    def __holds(self,body,required):
+        for x in body:
+            if x is None and required == set(): return False
+            if x is not None and x not in required: return False
+        return True
+
+    # return the statements without the rules that depend on relations that may not be required
+    def slice(self,statements):
+        edges = self.__edges(statements)
+        if edges is None: return statements
+        required, changed = set(), True
+        while changed:
+            changed = False
+            for body, head in edges:
+                if head not in required and self.__holds(body,required):
+                    required.add(head)
+                    changed = True
+        out = []
+        for i in statements:
+            if str(i.type) == "Rule":
+                body = [self.__constant(x) for x in self.__body(i)]
+                if not self.__holds([x for x in body if x is not None],required):
+                    self.removed += 1
+                    continue
+            out.append(i)
+        return out
+
+
+#
+# Determinism analysis of the preference programs
+#
+# A predicate is deterministic if it does not depend on the models:
+# every rule defining it has a simple atom as head,
+# and its body only refers to deterministic predicates and to keywords_det
+# that are not derived by the preference programs (see is_keyword()).
+# The rules of deterministic predicates are added to the base program,
+# their atoms are renamed but get no (m1,m2) arguments,
+# and their rules get no _volatile atom.
+# Predicates with the same name as a nondeterministic one are not deterministic,
+# since their atoms could be equal once the arguments are added.
+#
+class Analyzer:
+
+    def __init__(self,keywords_det,keywords_undet):
+        self.keywords_det   = keywords_det
+        self.keywords_undet = keywords_undet
+        self.rules          = {} # signature -> list of sets of signatures of the bodies
+        self.undet          = set()
+        self.all            = set()
+        self.heads          = set()
+
+    # return the signature of the head of the rule if it is a simple atom, or None
+    def head(self,rule):
+        if (str(rule.head.type) == "Literal"
+            and rule.head.sign == clingo.ast.Sign.None
+            and str(rule.head.atom.type) == "SymbolicAtom"):
+                head = signatures(rule.head,set())
+                if len(head) == 1: return head.pop()
+        return None
+
+    # return True if the signature is of keywords_det and it is not in the head of a rule or an #external
+    def is_keyword(self,signature):
+        return signature[0] in self.keywords_det and signature not in self.heads
+
+    def add(self,stm):
+        self.all.update(signatures(stm,set()))
+        if str(stm.type) == "Rule":
+            self.heads.update(signatures(stm.head,set()))
+            head = self.head(stm)
+            if head is not None:
+                self.rules.setdefault(head,[]).append(signatures(stm.body,set()))
+            else:
+                self.undet.update(signatures(stm.head,set()))
+        elif str(stm.type) == "External":
+            self.heads.update(signatures(stm.atom,set()))
+            self.undet.update(signatures(stm.atom,set()))
+
+    # return the set of deterministic signatures
+    def get_det(self):
+        det = set([x for x in self.rules if x not in self.undet and
+                   x[0] not in self.keywords_det and x[0] not in self.keywords_undet])
+        changed = True
+        while changed:
+            changed = False
+            undet = set([x[0] for x in self.all if x not in det])
+            for x in list(det):
+                if x[0] in undet:
+                    det.remove(x)
+                    changed = True
+                    continue
+                for body in self.rules[x]:
+                    if any([y not in det and not self.is_keyword(y) for y in body]):
+                        det.remove(x)
+                        changed = True
+                        break
+        return det
+
+
 class ProgramTransformer(Transformer):
 
     base, preference, other = "base", "preference", "other"
 
+    # terms and literals without symbolic atoms
+    leaves = set(["Variable","Symbol","UnaryOperation","BinaryOperation","Interval",
+                  "Function","Pool","Comparison","BooleanConstant"])
+
     def __volatile(self,loc):
         return clingo.ast.Literal(loc,clingo.ast.Sign.None,clingo.ast.SymbolicAtom(
                clingo.ast.Function(loc,self.underscore("volatile"),[clingo.ast.Symbol(loc,self.m1),clingo.ast.Symbol(loc,self.m2)],False)))
@@ -91,7 +305,14 @@ class ProgramTransformer(Transformer):
     def __init__(self,underscore=""):
         Transformer.__init__(self,underscore)
         self.term_transformer = TermTransformer(underscore)
+        self.term_transformer.det = self.det
         self.program = ProgramTransformer.base
+        self.volatile = True
+        self.analyzer = Analyzer(self.keywords_det,self.keywords_undet)
+        self.slicer = Slicer()
+        self.statements = []
+        self.program_location = None
+        self.last_program = "#program base."
 
     def __translate(self):
         return self.program==ProgramTransformer.preference
@@ -100,13 +321,46 @@ class ProgramTransformer(Transformer):
     # Statements
     #
 
-    # TODO: implement
+    # statements of the preference programs are stored in self.statements,
+    # and transformed by get_preference_statements() after the analysis of all of them
+    def add(self,stm):
+        if str(stm.type) == "Program":
+            self.program_location = stm.location
+            self.last_program = str(stm)
+            self.visit(stm)
+            return None if self.__translate() else stm
+        if not self.__translate(): return self.visit(stm)
+        self.statements.append(stm)
+        return None
+
+    # return the list of transformed statements of the preference programs after slicing them,
+    # with the rules of deterministic predicates in the base program
+    def get_preference_statements(self):
+        if self.statements == []: return []
+        self.statements = self.slicer.slice(self.statements)
+        for i in self.statements:
+            self.analyzer.add(i)
+        self.det.update(self.analyzer.get_det())
+        loc, self.program = self.program_location, ProgramTransformer.preference
+        base = [clingo.ast.Program(loc,"base",[])]
+        preference = [self.visit(clingo.ast.Program(loc,"preference",[]))]
+        for i in self.statements:
+            if   str(i.type) == "Rule"     and self.__head_is_det(i):      base.append(self.visit(i))
+            elif str(i.type) == "ShowTerm" and self.__body_is_det(i.body): base.append(self.visit(i))
+            else:                                                          preference.append(self.visit(i))
+        self.statements = []
+        return base + preference
+
     def __head_is_det(self,rule):
-        return False
+        return self.analyzer.head(rule) in self.det
 
     def visit_Rule(self,rule):
         if not self.__translate(): return rule
-        if self.__head_is_det(rule): return rule
+        if self.__head_is_det(rule):
+            self.volatile = False
+            self.visit_children(rule)
+            self.volatile = True
+            return rule
         if (str(rule.head.type) == "Literal"
             and str(rule.head.atom.type) == "BooleanConstant"
             and str(rule.head.atom.value == False)):
@@ -119,23 +373,27 @@ class ProgramTransformer(Transformer):
     def visit_Definition(self,d):
         return d
 
-    # TODO: implement
     def __sig_is_det(self,sig):
-        return False
+        return (sig.name,sig.arity) in self.det
 
     def visit_ShowSignature(self, sig):
         if not self.__translate(): return sig
-        if self.__sig_is_det: return sig
+        if self.__sig_is_det(sig):
+            sig.name = "_" + self.underscore(sig.name)
+            return sig
         sig.arity += 1
         return sig
 
-    # TODO: implement
     def __body_is_det(self,body):
-        return False
+        return all([x in self.det or self.analyzer.is_keyword(x) for x in signatures(body,set())])
 
     def visit_ShowTerm(self,show):
         if not self.__translate(): return show
-        if self.__body_is_det(show.body): return show
+        if self.__body_is_det(show.body):
+            self.volatile = False
+            self.visit(show.body)
+            self.volatile = True
+            return show
         show.term = self.term_transformer.visit(show.term)
         self.visit(show.body)
         show.body.append(self.__volatile(show.location))
@@ -190,7 +448,7 @@ class ProgramTransformer(Transformer):
 
     def visit_ConditionalLiteral(self,c):
         self.visit_children(c)
-        if modify_conditional_literal:
+        if modify_conditional_literal and self.volatile:
             c.condition.append(self.__volatile(c.location))
         return c
 
@@ -201,18 +459,35 @@ class ProgramTransformer(Transformer):
 
     def visit_BodyAggregateElement(self,b):
         self.visit_children(b)
-        if modify_body_aggregate_element:
+        if modify_body_aggregate_element and self.volatile:
             b.condition.append(self.__volatile(self.location))
         return b
 
 
+#
+# Cache of programs (if programs is True)
+#   - for every chunk, keyed by its md5 and the program where it starts:
+#     the text of its statements outside the preference programs, the text of those inside,
+#     and the program where it ends
+#   - for the preference programs, keyed by the md5 of their texts and the underscores:
+#     the text of their transformation, and the number of rules removed by the slicing
+# The texts of the cache are added with Control.add() instead of being parsed and transformed.
+#
 class Parser:
 
-    def __init__(self,underscores):
+    # options are passed to clingo.Control (e.g., "--parallel-mode=4", "--configuration=many")
+    def __init__(self,underscores,options=[],programs=False):
         self.underscores = underscores
+        self.options = options
+        self.sliced = 0
+        self.cache = None
+        if programs: self.cache = cache.Cache(PROGRAMS + "-" + get_sources_hash(),CACHE_SIZE)
 
     def get_control(self):
-        options = ["-Wnone"]
+        options = ["-Wnone"] + self.options
+        # statistics per thread
+        if any([i.startswith("--parallel-mode") or i.startswith("-t") for i in self.options]):
+            options.append("--stats=2")
         #options.append("--output-debug=text")
         return clingo.Control(options)
 
@@ -228,14 +503,83 @@ class Parser:
                 print x
         return control
 
+    # parses the chunk with t, adding the statements outside the preference programs to b,
+    # and returns the pair (text,preference) of the cache if self.cache is not None
+    # after the first chunk, the #program base. that starts the chunk is replaced
+    # by the program where the previous chunk ended, which is also added to b
+    # (b has not seen it if the previous chunk was read from the cache)
+    def __parse_chunk(self,chunk,t,b,first):
+        skip, start, programs = [not first], t.last_program, []
+        text, preference = [start], ["#program preference."]
+        if not first: clingo.parse_program(start,programs.append)
+        def add(stm):
+            if skip[0]:
+                skip[0] = False
+                if str(stm.type) == "Program": stm = programs[-1]
+            out = t.add(stm)
+            if out is not None:
+                b.add(out)
+                if self.cache is not None: text.append(str(out))
+            elif self.cache is not None and str(stm.type) != "Program":
+                preference.append(str(stm))
+        clingo.parse_program(chunk,add)
+        if self.cache is None: return None
+        return "\n".join(text) + "\n", "\n".join(preference) + "\n"
+
+    # program is a string, or a list of strings parsed one after the other:
+    # every call to clingo.parse_program starts with #program base,
+    # which is replaced after the first string to continue in the program of the previous one
     def parse(self,program):
         #return self.parse_test(program)
+        if isinstance(program,str): program = [program]
         control = self.get_control()
+        t, texts, preferences, pending = ProgramTransformer(self.underscores), [], [], []
         with control.builder() as b:
-            t = ProgramTransformer(self.underscores)
-            clingo.parse_program(program,lambda stm: b.add(t.visit(stm)))
+            for i, chunk in enumerate(program):
+                value = None
+                if self.cache is not None:
+                    key = hashlib.md5(t.last_program + "\n" + chunk).hexdigest()
+                    value = self.cache.get(key)
+                if value is not None:
+                    text, preference, last = value
+                    clingo.parse_program(last,t.add)
+                    texts.append(text)
+                    pending.append(preference)
+                else:
+                    value = self.__parse_chunk(chunk,t,b,i == 0)
+                    if value is None: continue
+                    text, preference = value
+                    self.cache.put(key,(text,preference,t.last_program))
+                preferences.append(preference)
+            transformed = None
+            if self.cache is not None:
+                key = hashlib.md5(self.underscores + "\n" + "".join(preferences)).hexdigest()
+                transformed = self.cache.get(key)
+            if transformed is None:
+                for i in pending:
+                    clingo.parse_program(i,t.add)
+                statements = t.get_preference_statements()
+                for i in statements:
+                    b.add(i)
+                self.sliced = t.slicer.removed
+                if self.cache is not None:
+                    self.cache.put(key,("\n".join([str(i) for i in statements]) + "\n",self.sliced))
+        for i in texts:
+            control.add("base",[],i)
+        if transformed is not None:
+            control.add("base",[],transformed[0])
+            self.sliced = transformed[1]
         return control
 
+    # return the number of rules removed by the slicing of the last parse
+    def get_sliced(self):
+        return self.sliced
+
+    # return the pair (hits,misses) of the cache
+    def get_cache_statistics(self):
+        if self.cache is None: return 0, 0
+        return self.cache.hits, self.cache.misses
+
 
 def main(prg):
     with prg.builder() as b:
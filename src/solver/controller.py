@@ -10,10 +10,10 @@ class GeneralController:
         self.solver = _solver
         self.state  = state
         self.solver.register_pre(solver.START,self.start)
-        self.solver.register_pre(solver.SOLVE,self.solve)
         self.solver.register_pre(solver.SAT,self.sat)
         self.solver.register_pre(solver.UNSAT,self.unsat_pre)
         self.solver.register_post(solver.UNSAT,self.unsat_post)
+        self.solver.register_pre(solver.UNKNOWN,self.unknown)
         self.solver.register_pre(solver.END_LOOP,self.end_loop)
         self.state.step       = 1
         self.state.start_step = 1
@@ -25,9 +25,6 @@ class GeneralController:
     def start(self):
         return [self.solver.ground_base]
 
-    def solve(self):
-        return [self.solver.solve]
-
     def sat(self):
         self.state.models += 1
         self.state.last_unsat = False
@@ -40,12 +37,16 @@ class GeneralController:
         out = [self.solver.print_optimum_string]
         if self.state.max_models == self.state.opt_models:
             out.append(self.solver.end)
-        out.append(self.solver.handle_optimal_models)
         return out
 
     def unsat_post(self):
         self.state.start_step = self.state.step+1
 
+    # the solving limits were reached
+    def unknown(self):
+        self.state.interrupted = True
+        return [self.solver.print_interrupted_string,self.solver.end]
+
     def end_loop(self):
         state = self.state
         state.step = state.step + 1
@@ -58,11 +59,108 @@ class BasicMethodController:
         self.solver = _solver
         self.state  = state
         self.solver.register_pre(solver.START_LOOP,self.start_loop)
+        self.solver.register_pre(solver.SOLVE,self.solve)
         self.solver.register_pre(solver.UNSAT,self.unsat_pre)
 
     def start_loop(self):
         if self.state.step > self.state.start_step: return [self.solver.ground_preference_program]
 
+    def solve(self):
+        return [self.solver.solve]
+
     def unsat_pre(self):
         logging.info("BasicMethodController unsat_pre")
-        return [self.solver.relax_previous_models]
+        return [self.solver.handle_optimal_models,self.solver.relax_previous_models]
+
+
+class GroundOnceController:
+
+    def __init__(self,_solver,state):
+        self.solver = _solver
+        self.state  = state
+        self.solver.register_pre(solver.START,self.start)
+        self.solver.register_pre(solver.START_LOOP,self.start_loop)
+        self.solver.register_pre(solver.SOLVE,self.solve)
+        self.solver.register_pre(solver.UNSAT,self.unsat_pre)
+
+    def start(self):
+        return [self.solver.ground_preference_program_once]
+
+    def start_loop(self):
+        if self.state.step > self.state.start_step: return [self.solver.assign_previous_model]
+
+    def solve(self):
+        return [self.solver.solve]
+
+    def unsat_pre(self):
+        return [self.solver.handle_optimal_models,self.solver.unassign_previous_models]
+
+
+#
+# Solves with the #minimize statements of the spec_parser.
+# In the first round, every model of the search improves the previous one.
+# In the next rounds, the search is bounded by the cost of the first optimal model,
+# and every model found is optimal.
+#
+class MinimizeMethodController:
+
+    def __init__(self,_solver,state):
+        self.solver = _solver
+        self.state  = state
+        self.solver.register_pre(solver.START,self.start)
+        self.solver.register_pre(solver.SOLVE,self.solve)
+        self.solver.register_pre(solver.UNSAT,self.unsat_pre)
+
+    def start(self):
+        return [self.solver.start_minimize]
+
+    def solve(self):
+        return [self.solver.solve_minimize]
+
+    def unsat_pre(self):
+        return [self.solver.handle_optimal_models_minimize]
+
+
+class HeuristicController:
+
+    def __init__(self,_solver,state):
+        self.solver = _solver
+        self.state  = state
+        self.solver.register_pre(solver.START,self.start)
+
+    def start(self):
+        return [self.solver.ground_heuristic]
+
+
+class CompactionController:
+
+    def __init__(self,_solver,state):
+        self.solver = _solver
+        self.state  = state
+        self.solver.register_pre(solver.START_LOOP,self.start_loop)
+        self.state.restarts = 0
+
+    # restart only between rounds, when no model is being improved
+    def start_loop(self):
+        if self.state.step == self.state.start_step and self.state.opt_models > 0:
+            if self.solver.ground_program_size() > self.state.compaction:
+                return [self.solver.restart]
+
+
+class CoreMethodController:
+
+    def __init__(self,_solver,state):
+        self.solver = _solver
+        self.state  = state
+        self.solver.register_pre(solver.START,self.start)
+        self.solver.register_pre(solver.SOLVE,self.solve)
+        self.solver.register_pre(solver.UNSAT,self.unsat_pre)
+
+    def start(self):
+        return [self.solver.start_core]
+
+    def solve(self):
+        return [self.solver.solve_core]
+
+    def unsat_pre(self):
+        return [self.solver.handle_optimal_models_core]
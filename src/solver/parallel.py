@@ -0,0 +1,288 @@
+#script (python)
+
+import clingo
+import multiprocessing
+import itertools
+import math
+import os
+import sys
+import time
+import solver
+from src.pp_parser import pp_parser
+
+
+#
+# Parallel enumeration of optimal models (ParallelSolver)
+#
+# The search space is split on the first non-fact atoms _holds(X,0) into disjoint cubes,
+# and a worker process with its own control computes all optimal models of each cube.
+# The time limit counts from the start of the parallel solving, and not from the start of every cube.
+# Every optimal model is optimal in its cube, and an optimal model of a cube
+# is optimal if no model is better than it, which is checked again by the workers.
+#
+
+#
+# Portfolio of solver configurations (PortfolioSolver)
+#
+# Every worker process runs the whole solver with a different configuration.
+# The first worker that finishes with an optimum or proving unsatisfiability wins, and the others are terminated.
+# Workers that are interrupted or fail with an error lose.
+# If all of them lose, the optimal models and the best models of every worker are merged.
+#
+
+# name, options, and clingo options of every configuration
+PORTFOLIO = [
+    ("basic",       dict(method=solver.BASIC),                  []),
+    ("minimize",    dict(method=solver.MINIMIZE),               []),
+    ("heuristic",   dict(method=solver.BASIC,heuristic=True),   []),
+    ("core",        dict(method=solver.CORE),                   []),
+    ("ground-once", dict(method=solver.BASIC,ground_once=True), []),
+    ("crafty",      dict(method=solver.BASIC),                  ["--configuration=crafty"]),
+    ("trendy",      dict(method=solver.BASIC),                  ["--configuration=trendy"]),
+    ("jumpy",       dict(method=solver.BASIC),                  ["--configuration=jumpy"]),
+]
+
+# status of a finished worker
+OPTIMUM, UNSAT, INTERRUPTED, UNKNOWN, ERROR = "optimum", "unsat", "interrupted", "unknown", "error"
+
+# global variables of the worker processes
+program, underscores, options, checker = None, None, None, None
+
+
+#
+# Workers
+#
+
+def init(_program=None,_underscores=None,_options=None):
+    global program, underscores, options
+    program, underscores, options = _program, _underscores, _options
+    sys.stdout = open(os.devnull,"w")
+
+def get_control():
+    return pp_parser.Parser(underscores,options["clingo_options"],programs=options["cache"]).parse(program)
+
+def get_solver():
+    _solver = WorkerSolver(get_control(),get_control)
+    _solver.set_options(options)
+    return _solver
+
+
+# records the optimal models and the last model instead of printing them
+class WorkerSolver(solver.Solver):
+
+    def __init__(self,control,control_factory=None):
+        solver.Solver.__init__(self,control,control_factory)
+        self.models = []
+        self.last   = None
+
+    def print_shown(self):
+        self.last = ' '.join(map(str,self.shown))
+
+    def print_optimum_string(self):
+        self.models.append((' '.join(map(str,self.shown)),[str(x) for x in solver.holds]))
+        self.last = None
+
+
+# input: list of pairs (X,sign) for the atoms _holds(X,0)
+# output: optimal models of the cube, number of models, whether it was interrupted, calls,
+#         and the error message or None
+def solve_cube(cube):
+    try:
+        _solver = get_solver()
+        _solver.state.cube = [(clingo.Function(solver.HOLDS,[clingo.parse_term(x),clingo.Number(0)]),sign) for x, sign in cube]
+        _solver.state.max_models = 0
+        _solver.run()
+    except Exception as e:
+        return [], 0, False, 0, str(e)
+    state = _solver.state
+    return _solver.models, state.models, state.interrupted, state.calls, state.error
+
+
+# input: pair (step,holds) of an optimal model of a cube
+# output: pair (result,error) where result is SATISFIABLE if some model is better,
+#         UNSATISFIABLE if it is optimal, or None if the limits were reached or there was an error
+def check(model):
+    global checker
+    step, solver.holds = model[0], [clingo.parse_term(x) for x in model[1]]
+    try:
+        if checker is None:
+            checker = get_solver()
+            checker.ground_base()
+        checker.add_holds(step)
+        checker.control.ground([(solver.PREFERENCE,    [0,step]),
+                                (solver.NOT_UNSAT_PRG,[0,step]),(solver.VOLATILE_EXT,[0,step])])
+        volatile = clingo.Function(solver.VOLATILE,[0,step])
+        checker.control.assign_external(volatile,True)
+        result = checker.solve_assumptions([])
+        checker.control.release_external(volatile)
+    except Exception as e:
+        checker = None
+        return None, str(e)
+    return result, None
+
+
+# return the status of a solver that has finished
+def get_status(state):
+    if state.error is not None: return ERROR
+    if state.interrupted:       return INTERRUPTED
+    if state.opt_models > 0:    return OPTIMUM
+    if state.models == 0:       return UNSAT
+    return UNKNOWN
+
+
+# input: tuple (name,program,underscores,options) of a configuration of the portfolio
+# output: name, optimal models, last model that is not optimal, number of models, status, calls,
+#         and the error message or None
+def solve_configuration(configuration):
+    global program, underscores, options
+    name, program, underscores, options = configuration
+    try:
+        _solver = get_solver()
+        _solver.run()
+    except Exception as e:
+        return name, [], None, 0, ERROR, 0, str(e)
+    state = _solver.state
+    return name, _solver.models, _solver.last, state.models, get_status(state), state.calls, state.error
+
+
+#
+# ParallelSolver
+#
+
+class ParallelSolver:
+
+    def __init__(self,control,program,underscores,options):
+        self.control     = control
+        self.program     = program
+        self.underscores = underscores
+        self.options     = options
+        self.processes   = options["processes"]
+
+    # cubes of the first log2(processes)+1 non-fact atoms _holds(X,0)
+    def get_cubes(self):
+        _solver = solver.Solver(self.control)
+        _solver.ground_base()
+        atoms = self.control.symbolic_atoms
+        split = sorted([x for x in _solver.holds_index
+                        if not atoms[clingo.Function(solver.HOLDS,[x,clingo.Number(0)])].is_fact])
+        split = [str(x) for x in split[:int(math.ceil(math.log(self.processes,2)))+1]]
+        return [zip(split,signs) for signs in itertools.product([True,False],repeat=len(split))]
+
+    def run(self):
+        cubes = self.get_cubes()
+        print "Solving..."
+        self.options["start_time"] = time.time()
+        pool = multiprocessing.Pool(self.processes,init,(self.program,self.underscores,self.options))
+        try:
+            results = pool.map(solve_cube,cubes)
+            candidates = [m for r in results for m in r[0]]
+            checks = pool.map(check,[(i+1,m[1]) for i, m in enumerate(candidates)])
+        finally:
+            pool.terminate()
+        errors = 0
+        for cube, r in zip(cubes,results):
+            if r[4] is not None:
+                errors += 1
+                print "ERROR (cube " + " ".join([("" if sign else "not ") + x for x, sign in cube]) + "): " + r[4]
+        for m, c in zip(candidates,checks):
+            if c[1] is not None:
+                errors += 1
+                print "ERROR (check " + m[0] + "): " + c[1]
+        optimal = [m for m, c in zip(candidates,checks) if c[0] == solver.UNSATISFIABLE]
+        if self.options["max_models"]: optimal = optimal[:self.options["max_models"]]
+        for shown, holds in optimal:
+            print "Answer: "
+            print shown
+            print solver.OPTIMUM_FOUND
+        interrupted = any([r[2] for r in results]) or any([c[0] is None and c[1] is None for c in checks])
+        models = sum([r[1] for r in results])
+        if optimal != []:                          optimum = "yes"
+        elif errors or interrupted and models > 0: optimum = "unknown"
+        else:                                      optimum = "no"
+        print
+        print "Models\t\t: "  + str(models)
+        print "  Optimum\t: " + optimum
+        print "  Optimal\t: " + str(len(optimal))
+        print "  Candidates\t: " + str(len(candidates))
+        print "Calls\t\t: "   + str(sum([r[3] for r in results]) + len(checks))
+        if errors:
+            print "Errors\t\t: " + str(errors)
+        print "Cubes\t\t: "   + str(len(cubes))
+        print "Processes\t: " + str(self.processes)
+
+
+#
+# PortfolioSolver
+#
+
+class PortfolioSolver:
+
+    # minimize is the string with the #minimize statements, and core the pair (name,type), or None
+    def __init__(self,program,underscores,options,minimize,core):
+        self.program     = program
+        self.underscores = underscores
+        self.options     = options
+        self.minimize    = minimize
+        self.core        = core
+        self.processes   = options["portfolio"]
+
+    # the configurations of PORTFOLIO that apply, repeated with different seeds if needed
+    def get_configurations(self):
+        portfolio = [c for c in PORTFOLIO if
+                     (c[1]["method"] != solver.MINIMIZE or self.minimize is not None) and
+                     (c[1]["method"] != solver.CORE     or self.core     is not None)]
+        out = []
+        for i in range(self.processes):
+            name, _options, clingo_options = portfolio[i % len(portfolio)]
+            if i >= len(portfolio):
+                name, clingo_options = name + ",seed=" + str(i), clingo_options + ["--seed=" + str(i)]
+            options, program = dict(self.options), self.program
+            options.update(_options)
+            options["clingo_options"] = self.options["clingo_options"] + clingo_options
+            if options["method"] == solver.MINIMIZE: program = program + self.minimize
+            if options["method"] == solver.CORE:
+                options["core_statement"], options["core_type"] = self.core
+            out.append((name,program,self.underscores,options))
+        return out
+
+    def run(self):
+        self.options["start_time"] = time.time()
+        configurations = self.get_configurations()
+        print "Solving..."
+        pool, results = multiprocessing.Pool(len(configurations),init), []
+        try:
+            for result in pool.imap_unordered(solve_configuration,configurations):
+                results.append(result)
+                if result[4] in [OPTIMUM,UNSAT]: break
+        finally:
+            pool.terminate()
+        winner = results[-1][0] if results[-1][4] in [OPTIMUM,UNSAT] else None
+        for r in results:
+            if r[4] == ERROR: print "ERROR (" + r[0] + "): " + r[6]
+        if winner is not None: results = results[-1:]
+        optimal, shown = [], set()
+        for r in results:
+            for m in r[1]:
+                if m[0] not in shown: optimal.append(m[0])
+                shown.add(m[0])
+        for m in optimal:
+            print "Answer: "
+            print m
+            print solver.OPTIMUM_FOUND
+        if winner is None:
+            print solver.INTERRUPTED
+            for r in results:
+                if r[2] is not None:
+                    print "Best model found (" + r[0] + "): "
+                    print r[2]
+        models = sum([r[3] for r in results])
+        if optimal != []:                        optimum = "yes"
+        elif winner is None:                     optimum = "unknown"
+        else:                                    optimum = "no"
+        print
+        print "Models\t\t: "  + str(models)
+        print "  Optimum\t: " + optimum
+        print "  Optimal\t: " + str(len(optimal))
+        print "Calls\t\t: "   + str(sum([r[5] for r in results]))
+        print "Processes\t: " + str(len(configurations))
+        print "Winner\t\t: "  + (winner if winner is not None else "none")
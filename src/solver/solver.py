@@ -8,6 +8,7 @@ import clingo
 import pdb
 import controller
 import os
+import time
 
 
 #
@@ -37,21 +38,42 @@ UNSATISFIABLE = "UNSATISFIABLE"
 
 # strings
 OPTIMUM_FOUND = "OPTIMUM FOUND"
+INTERRUPTED   = "INTERRUPTED"
 
 # program names
 ENCODINGS     = os.path.dirname(os.path.realpath(__file__)) + "/encodings.lp"
 DO_HOLDS      = "_do_holds"
+HOLDS_EXT     = "_holds_external"
 PREFERENCE    = "_preference"
 NOT_UNSAT_PRG = "_not_unsat"
 UNSAT_PRG     =     "_unsat"
 VOLATILE_EXT  = "_volatile_external"
 VOLATILE_FACT = "_volatile_fact"
 DELETE_MODEL  = "_delete_model"
+HEURISTIC     = "_heuristic"
 
 # predicate and term names
 VOLATILE      = "_volatile"
+HOLDS         = "_holds"
 HOLDS_AT_ZERO = "_holds_at_zero"
 
+# model injection
+BACKEND       = "backend"
+CALLBACK      = "callback"
+
+# methods
+AUTO          = "auto"
+BASIC         = "basic"
+MINIMIZE      = "minimize"
+CORE          = "core"
+
+# accumulated clasp statistics (summed over threads and solve calls)
+CLASP_STATISTICS = ["choices","conflicts","restarts"]
+
+# preference types of the core method
+SUBSET        = "subset"
+SUPERSET      = "superset"
+
 
 #
 # GLOBAL VARIABLES
@@ -79,14 +101,42 @@ class State:
 
 class Solver:
 
-    def __init__(self,control):
+    def __init__(self,control,control_factory=None):
         self.state = State()
         self.solving_result = None
         self.control = control
+        self.control_factory = control_factory
         self.pre  = dict(START=[],START_LOOP=[],SOLVE=[],SAT=[],UNSAT=[],UNKNOWN=[],END_LOOP=[],END=[])
         self.post = dict(START=[],START_LOOP=[],SOLVE=[],SAT=[],UNSAT=[],UNKNOWN=[],END_LOOP=[],END=[])
         self.shown = []
-        self.state.max_models = 1
+        self.holds_index = {}
+        self.previous = {}
+        self.optimal_models = []
+        self.state.max_models  = 1
+        self.state.inject      = BACKEND
+        self.state.ground_once = False
+        self.state.slots       = 1
+        self.state.compaction  = 0
+        self.state.time_limit  = 0
+        self.state.solve_limit = 0
+        self.state.interrupted = False
+        self.state.error       = None
+        self.state.method      = BASIC
+        self.state.calls       = 0
+        self.state.underscores = "_"
+        self.state.heuristic   = False
+        self.state.statistics  = dict([(i,0) for i in CLASP_STATISTICS])
+        self.state.threads     = 1
+        self.state.thread_statistics = []
+        self.state.cube        = []
+        self.state.cache_hits   = 0
+        self.state.cache_misses = 0
+        self.state.sliced_rules = 0
+        self.state.start_time   = None
+        self.handle = None
+        self.cost   = None
+        self.start_time = time.time()
+        self.state.process_start = self.start_time
 
 
     #
@@ -98,16 +148,95 @@ class Solver:
         control.load(ENCODINGS)
         base = [("base",[])]
         control.ground(base)
+        self.build_holds_index()
+
+    # maps every X of _holds(X,0) to the literal of _holds(X,0)
+    def build_holds_index(self):
+        zero = clingo.Number(0)
+        self.holds_index = {}
+        for a in self.control.symbolic_atoms.by_signature(HOLDS,2):
+            if a.symbol.arguments[1] == zero:
+                self.holds_index[a.symbol.arguments[0]] = a.literal
+
+    # adds facts _holds(X,step) for the last model
+    def add_holds(self,step):
+        if self.state.inject == CALLBACK:
+            self.control.ground([(DO_HOLDS,[step])])
+            return
+        with self.control.backend() as backend:
+            for x in holds:
+                backend.add_rule([backend.add_atom(clingo.Function(HOLDS,[x,step]))])
+
+    # adds a nogood deleting the last model
+    def delete_model(self):
+        if self.state.inject == CALLBACK:
+            self.control.ground([(DELETE_MODEL,[])])
+            return
+        index = self.holds_index
+        with self.control.backend() as backend:
+            backend.add_rule([],[index[x] for x in holds] + [-index[x] for x in nholds])
 
     def ground_preference_program(self):
         state, control, prev_step = self.state, self.control, self.state.step-1
-        control.ground([(DO_HOLDS,       [prev_step]),(PREFERENCE,    [0,prev_step]),
+        self.add_holds(prev_step)
+        control.ground([(PREFERENCE,    [0,prev_step]),
                         (NOT_UNSAT_PRG,[0,prev_step]),(VOLATILE_EXT,[0,prev_step])])
         control.assign_external(clingo.Function(VOLATILE,[0,prev_step]),True)
 
+    # model term of the slot used for the model of step
+    def slot(self,step):
+        return -1 - ((step-1) % self.state.slots)
+
+    # grounds the preference program once per slot, comparing with the externals _holds(X,slot)
+    def ground_preference_program_once(self):
+        control, slots = self.control, [-i for i in range(1,self.state.slots+1)]
+        for slot in slots:
+            control.ground([(HOLDS_EXT,     [slot]),(PREFERENCE,    [0,slot]),
+                            (NOT_UNSAT_PRG,[0,slot]),(VOLATILE_EXT,[0,slot])])
+        self.previous = dict([(slot,[(x,clingo.Function(HOLDS,[x,slot])) for x in self.holds_index]) for slot in slots])
+
+    # writes the model of the previous step into its slot
+    def assign_previous_model(self):
+        control, true, slot = self.control, set(holds), self.slot(self.state.step-1)
+        for x, atom in self.previous[slot]:
+            control.assign_external(atom, x in true)
+        control.assign_external(clingo.Function(VOLATILE,[0,slot]),True)
+
+    def unassign_previous_models(self):
+        for slot in self.previous:
+            self.control.assign_external(clingo.Function(VOLATILE,[0,slot]),False)
+
+    def ground_program_size(self):
+        return len(self.control.symbolic_atoms)
+
+    # replaces the control by a fresh one with the base program and the optimal models
+    def restart(self):
+        global holds, nholds
+        logging.info("restart with %d atoms",self.ground_program_size())
+        last = holds, nholds
+        self.control = self.control_factory()
+        self.ground_base()
+        for step, holds, nholds in self.optimal_models:
+            self.add_optimal_model(step,True)
+        holds, nholds = last
+        if self.state.ground_once: self.ground_preference_program_once()
+        if self.state.heuristic:   self.ground_heuristic()
+        self.state.restarts += 1
+
+    # signs and levels for the formulas of the preference statements
+    def ground_heuristic(self):
+        self.control.configuration.solver.heuristic = "Domain"
+        self.control.ground([(HEURISTIC,[])])
+
     def print_optimum_string(self):
         print OPTIMUM_FOUND
 
+    def print_interrupted_string(self):
+        print INTERRUPTED
+        if not self.state.last_unsat:
+            print "Best model found: "
+            print '%s' % ' '.join(map(str,self.shown))
+
     def print_shown(self):
         print "Answer: "
         print '%s' % ' '.join(map(str,self.shown))
@@ -118,15 +247,170 @@ class Solver:
         for a in model.symbols(shown=True):
             if (a.name == HOLDS_AT_ZERO): holds.append(a.arguments[0])
             else:                            self.shown.append(a)
+        if self.state.inject == BACKEND:
+            true = set(holds)
+            nholds = [x for x in self.holds_index if x not in true]
+            return
         for a in model.symbols(terms=True,complement=True):
             if (a.name == HOLDS_AT_ZERO): nholds.append(a.arguments[0])
 
+    # seconds left for the next solve call, or None if there is no limit
+    def solve_timeout(self):
+        state, timeouts = self.state, []
+        if state.time_limit:  timeouts.append(state.time_limit - (time.time() - self.start_time))
+        if state.solve_limit: timeouts.append(state.solve_limit)
+        return max(0,min(timeouts)) if timeouts != [] else None
+
+    # returns SATISFIABLE, UNSATISFIABLE, or None if the solving limits were reached
+    def solve_assumptions(self,assumptions):
+        control, timeout = self.control, self.solve_timeout()
+        assumptions = self.state.cube + assumptions
+        self.state.calls += 1
+        if timeout is None:
+            result = control.solve(assumptions=assumptions,on_model=self.on_model)
+        else:
+            with control.solve(assumptions=assumptions,on_model=self.on_model,async=True) as handle:
+                if not handle.wait(timeout): handle.cancel()
+                result = handle.get()
+        self.update_statistics()
+        if result.satisfiable:     return   SATISFIABLE
+        elif result.unsatisfiable: return UNSATISFIABLE
+        return None
+
+    # adds the statistics of the last solve call, in total and per thread
+    # (the statistics per thread need --stats=2, see pp_parser.Parser.get_control())
+    def update_statistics(self):
+        solving = self.control.statistics.get("solving",{})
+        solvers = solving.get("solvers",{})
+        for i in CLASP_STATISTICS:
+            self.state.statistics[i] += int(solvers.get(i,0))
+        threads = int(str(self.control.configuration.solve.parallel_mode).split(",")[0])
+        self.state.threads = max(self.state.threads,threads)
+        for n, thread in enumerate(solving.get("threads",[])):
+            if n == len(self.state.thread_statistics):
+                self.state.thread_statistics.append(dict([(i,0) for i in CLASP_STATISTICS]))
+            for i in CLASP_STATISTICS:
+                self.state.thread_statistics[n][i] += int(thread.get(i,0))
+
     def solve(self):
-        control = self.control
-        result = control.solve(on_model=self.on_model)
+        self.solving_result = self.solve_assumptions([])
+
+    #
+    # MINIMIZE METHOD
+    #
+
+    def start_minimize(self):
+        configuration = self.control.configuration
+        configuration.solve.opt_mode = "opt"
+        configuration.solve.models   = "0"
+
+    # every call returns the next model of the current round
+    def solve_minimize(self):
         self.solving_result = None
-        if result.satisfiable:     self.solving_result =   SATISFIABLE
-        elif result.unsatisfiable: self.solving_result = UNSATISFIABLE
+        self.state.calls += 1
+        if self.handle is None:
+            self.handle = self.control.solve(assumptions=self.state.cube,yield_=True,async=True)
+        else:
+            self.handle.resume()
+        timeout = self.solve_timeout()
+        if timeout is None:
+            self.handle.wait()
+        elif not self.handle.wait(timeout):
+            self.handle.cancel()
+            self.handle.close()
+            self.handle = None
+            self.update_statistics()
+            return
+        model = self.handle.model()
+        if model is not None:
+            self.on_model(model)
+            self.cost = model.cost
+            self.solving_result = SATISFIABLE
+            return
+        self.handle.close()
+        self.handle = None
+        self.update_statistics()
+        self.solving_result = UNSATISFIABLE
+
+    # the last model is optimal:
+    # delete it, and bound the next rounds by its cost
+    def handle_optimal_models_minimize(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle.close()
+            self.handle = None
+            self.update_statistics()
+        self.delete_model()
+        configuration = self.control.configuration
+        configuration.solve.opt_mode = "enum," + ",".join([str(i) for i in self.cost])
+        configuration.solve.models   = "1"
+
+    #
+    # CORE METHOD
+    #
+
+    # collects the formulas X of _holds(X,0) in the optimized subset or superset statement
+    def start_core(self):
+        name, atoms = clingo.parse_term(self.state.core_statement), set()
+        for a in self.control.symbolic_atoms.by_signature(self.state.underscores+"preference",5):
+            args = a.symbol.arguments
+            if args[0] == name and args[3].name == "for":
+                atoms.add(args[3].arguments[0])
+        self.core_atoms = dict([(x,clingo.Function(HOLDS,[x,0])) for x in atoms if x in self.holds_index])
+        self.core_pending = None
+        self.state.cores  = 0
+
+    # formulas of the optimized statement true in the last model
+    def core_holds(self):
+        return set([x for x in holds if x in self.core_atoms])
+
+    #
+    # The first call of a round looks for a model.
+    # The next calls try to remove (subset) or add (superset) one pending formula at a time,
+    # assuming that the formulas outside (subset) or inside (superset) the last model keep their value.
+    # If this is unsatisfiable, the formula is fixed: it keeps its value in every better model.
+    # Every call returns either a better model or, once no formula is pending, UNSATISFIABLE.
+    # This is not core-guided: clingo does not return unsatisfiable cores,
+    # so there is one solve call per formula, and no call fixes more than one formula.
+    #
+    def solve_core(self):
+        subset = self.state.core_type == SUBSET
+        if self.core_pending is None:
+            self.solving_result = self.solve_assumptions([])
+            if self.solving_result == SATISFIABLE:
+                self.core_fixed = set()
+                current = self.core_holds()
+                self.core_pending = [x for x in self.core_atoms if (x in current) == subset]
+            return
+        while self.core_pending != []:
+            x, current = self.core_pending.pop(0), self.core_holds()
+            assumptions  = [(atom,not subset) for y, atom in self.core_atoms.items()
+                                              if (y in current) != subset or y == x]
+            assumptions += [(self.core_atoms[y],subset) for y in self.core_fixed]
+            self.solving_result = self.solve_assumptions(assumptions)
+            if self.solving_result == SATISFIABLE:
+                current = self.core_holds()
+                self.core_pending = [y for y in self.core_pending if (y in current) == subset]
+                return
+            if self.solving_result is None: return
+            self.core_fixed.add(x)
+            self.state.cores += 1
+        self.core_pending = None
+        self.solving_result = UNSATISFIABLE
+
+    # the last model is optimal:
+    # delete it, and delete the models that it dominates
+    def handle_optimal_models_core(self):
+        index, current = self.holds_index, self.core_holds()
+        inside  = [index[x] for x in self.core_atoms if x in current]
+        outside = [index[x] for x in self.core_atoms if x not in current]
+        if self.state.core_type == SUBSET: fixed, rest = inside, outside
+        else:                              fixed, rest = [-l for l in outside], [-l for l in inside]
+        with self.control.backend() as backend:
+            worse = backend.add_atom()
+            backend.add_weight_rule([worse],1,[(l,1) for l in rest])
+            backend.add_rule([],fixed + [worse])
+        self.delete_model()
 
     def relax_previous_model(self):
         state, control = self.state, self.control
@@ -138,18 +422,45 @@ class Solver:
             control.release_external(clingo.Function("_volatile",[0,i]))
 
     def handle_optimal_models(self):
-        state, control, prev_step = self.state, self.control, self.state.step-1
-        preference   = [(PREFERENCE,   [prev_step,0])]
-        unsat        = [(UNSAT_PRG,    [prev_step,0])]
-        delete_model = [(DELETE_MODEL,            [])]
-        volatile     = [(VOLATILE_FACT,[prev_step,0])]
-        control.ground(preference + unsat + delete_model + volatile)
+        state, prev_step = self.state, self.state.step-1
+        if state.compaction: self.optimal_models.append((prev_step,holds,nholds))
+        self.add_optimal_model(prev_step,state.ground_once)
+
+    def add_optimal_model(self,step,with_holds):
+        if with_holds: self.add_holds(step)
+        preference   = [(PREFERENCE,   [step,0])]
+        unsat        = [(UNSAT_PRG,    [step,0])]
+        volatile     = [(VOLATILE_FACT,[step,0])]
+        self.control.ground(preference + unsat + volatile)
+        self.delete_model()
 
     def end(self):
         print
         print "Models\t\t: "  + str(self.state.models)
-        print "  Optimum\t: " + ("yes" if self.state.opt_models>0 else "no")
+        if self.state.opt_models > 0:                         optimum = "yes"
+        elif self.state.interrupted and self.state.models > 0: optimum = "unknown"
+        else:                                                  optimum = "no"
+        print "  Optimum\t: " + optimum
         print "  Optimal\t: " + str(self.state.opt_models)
+        print "Steps\t\t: "   + str(self.state.step)
+        if self.state.heuristic:
+            print "  Heuristic\t: domain"
+        print "Calls\t\t: "   + str(self.state.calls)
+        if self.state.method == CORE:
+            print "  Fixed\t\t: " + str(self.state.cores)
+        print "Threads\t\t: " + str(self.state.threads)
+        if len(self.state.thread_statistics) > 1:
+            for n, thread in enumerate(self.state.thread_statistics):
+                print "  Thread " + str(n) + "\t: " + ", ".join([str(thread[i]) + " " + i for i in CLASP_STATISTICS])
+        print "Choices\t\t: " + str(self.state.statistics["choices"])
+        print "Conflicts\t: "  + str(self.state.statistics["conflicts"])
+        print "Restarts\t: "   + str(self.state.statistics["restarts"])
+        print "Startup\t\t: "  + "%.3fs" % self.state.startup
+        if self.state.cache_hits + self.state.cache_misses > 0:
+            print "  Cache hits\t: "   + str(self.state.cache_hits)
+            print "  Cache misses\t: " + str(self.state.cache_misses)
+        if self.state.sliced_rules > 0:
+            print "  Sliced rules\t: " + str(self.state.sliced_rules)
         raise EndException
 
     #
@@ -159,6 +470,9 @@ class Solver:
     def set_options(self,options):
         for key,value in options.items():
             setattr(self.state,key,value)
+        # the time limit counts from start_time if it is given (e.g., by the parent of a worker)
+        if self.state.start_time is not None:
+            self.start_time = self.state.start_time
 
 
     #
@@ -182,9 +496,23 @@ class Solver:
 
     def run(self):
         controller.GeneralController(self,self.state)
-        controller.BasicMethodController(self,self.state)
+        if self.state.method == MINIMIZE:
+            controller.MinimizeMethodController(self,self.state)
+        elif self.state.method == CORE:
+            controller.CoreMethodController(self,self.state)
+        elif self.state.ground_once:
+            controller.GroundOnceController(self,self.state)
+        else:
+            controller.BasicMethodController(self,self.state)
+        if self.state.heuristic:
+            controller.HeuristicController(self,self.state)
+        if self.state.compaction and self.state.method == BASIC:
+            controller.CompactionController(self,self.state)
+        if self.state.start_time is None:
+            self.start_time = time.time()
         try:
             self.action(START)
+            self.state.startup = time.time() - self.state.process_start
             print "Solving..."
             while True:
                 self.action(START_LOOP)
@@ -194,7 +522,9 @@ class Solver:
                 elif self.solving_result == UNSATISFIABLE: self.action(UNSAT)
                 else:                                      self.action(UNKNOWN)
                 self.action(END_LOOP)
-        except RuntimeError as e: print "ERROR (clingo): " + str(e)
+        except RuntimeError as e:
+            self.state.error = str(e)
+            print "ERROR (clingo): " + str(e)
         except EndException as e: self.action(END)
 
 
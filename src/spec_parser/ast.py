@@ -58,30 +58,62 @@ _true.
 
 # Translate ast to string
 def ast2str(ast):
-    out = ""
-    if ast == None:         return out
+    if ast is None:         return ""
     if isinstance(ast,str): return ast
+    out = []
+    ast2list(ast,out)
+    return "".join(out)
+
+
+# Append the strings of ast to out
+def ast2list(ast,out):
     for e in ast:
-        out += ast2str(e)
-    return out
+        if isinstance(e,str): out.append(e)
+        elif e is not None:   ast2list(e,out)
 
 
 # Translate body to string
 def body2str(i):
-    out = ""
-    if isinstance(i,list) and len(i) > 0:
+    out = []
+    body2list(i,out)
+    return "".join(out)
+
+
+# Append the strings of body i to out
+def body2list(i,out):
+    if isinstance(i,str):
+        if   i == NOT:        out.append(NOT + " ")
+        elif i != "ext_atom": out.append(i)
+    elif i is not None and len(i) > 0:
         if isinstance(i[0],str) and i[0] in { "atom", "true", "false", "cmp" }:
-            return ast2str(i[1])
+            out.append(ast2str(i[1]))
+            return
         for j in i:
-            out += body2str(j)
-    return out
+            body2list(j,out)
+
+
+
+#
+# The classes of the statements, elements and weighted bodies have __slots__,
+# and terms are nested tuples of (interned) strings
+#
+
+# state of a translation:
+#   the underscores, and whether there are boolean formulas which are not literals
+class Translation(object):
+
+    __slots__ = ("underscores","bfs")
+
+    def __init__(self,underscores):
+        self.underscores = underscores
+        self.bfs         = False
 
 
 
 # abstract class for preference and optimize statements
-class Statement:
+class Statement(object):
 
-    underscores = ""
+    __slots__ = ("number","name","type","elements","body")
 
     def __init__(self):
         self.number   = None
@@ -95,8 +127,7 @@ class Statement:
 # preference statement
 class PStatement(Statement):
 
-
-    bfs = False # True if there are boolean formulas which are not literals
+    __slots__ = ()
 
 
     def __has_var(self,ast):
@@ -107,8 +138,7 @@ class PStatement(Statement):
         return False
 
 
-    def __create_body(self,preds,names):
-        u = Statement.underscores
+    def __create_body(self,preds,names,u):
         preds = set([ ast2str(x) for x in preds if self.__has_var(x) ])
         bodyp = ", ".join([u+DOM+"("+pred+")" for pred in preds])
         names = set([ ast2str(x) for x in names if self.__has_var(x) ])
@@ -116,8 +146,7 @@ class PStatement(Statement):
         if bodyp!="" and bodyn!="": return bodyp + ", " + bodyn
         return bodyp + bodyn
 
-    def __create_body(self,element):
-        u = Statement.underscores
+    def __create_body(self,element,u):
         out = []
         for j in element.sets:
             for k in j:
@@ -127,10 +156,15 @@ class PStatement(Statement):
         return ", ".join(u+DOM+"("+i+")" for i in out)
 
 
-    def str(self):
+    def str(self,t):
+        return "".join(self.translate(t))
+
+
+    # yields the translation in pieces, given the Translation t
+    def translate(self,t):
 
         # underscores
-        u = Statement.underscores
+        u = t.underscores
 
         # tostring
         name = ast2str(self.name)
@@ -139,7 +173,7 @@ class PStatement(Statement):
         # pref/2
         statement_body = body2str(self.body) if self.body is not None else ""
         arrow = " :- " if statement_body != "" else ""
-        out = u + PREFERENCE + "({},{}){}{}.\n".format(name,type,arrow,statement_body)
+        yield u + PREFERENCE + "({},{}){}{}.\n".format(name,type,arrow,statement_body)
 
         # pref/5
         elem = 1
@@ -149,8 +183,8 @@ class PStatement(Statement):
 
             # body
             if i.body is not None:    body = body2str(i.body)
-            else:                     body = self.__create_body(i)
-            #else:                     body = self.__create_body(i.preds,i.names)
+            else:                     body = self.__create_body(i,u)
+            #else:                     body = self.__create_body(i.preds,i.names,u)
             if statement_body != "":
                 if body != "": body += ", "
                 body += statement_body
@@ -159,37 +193,41 @@ class PStatement(Statement):
             # head sets
             for j in i.sets:
                 for k in j:
-                    out += u + PREFERENCE + "({},(({},{}),({})),{},{},{}){}{}.\n".format(
-                                name,self.number,elem,",".join(i.vars),set,k.str_body(),k.str_weight(),arrow,body)
-                    out += k.str_holds(body)
-                    out += k.str_bf   (body)
-                    out += k.str_sat  (body)
-                    out += "\n"
+                    yield u + PREFERENCE + "({},(({},{}),({})),{},{},{}){}{}.\n".format(
+                                name,self.number,elem,",".join(i.vars),set,k.str_body(t),k.str_weight(),arrow,body)
+                    yield k.str_holds(t,body)
+                    yield k.str_bf   (t,body)
+                    yield k.str_sat  (t,body)
+                    yield "\n"
                 set += 1
 
             # condition set
             for k in i.cond:
-                out +=     u + PREFERENCE + "({},(({},{}),({})),{},{},{}){}{}.\n".format(
-                                name,self.number,elem,",".join(i.vars),  0,k.str_body(),k.str_weight(),arrow,body)
-                out += "\n"
+                yield     u + PREFERENCE + "({},(({},{}),({})),{},{},{}){}{}.\n".format(
+                                name,self.number,elem,",".join(i.vars),  0,k.str_body(t),k.str_weight(),arrow,body)
+                yield "\n"
 
             elem += 1
         #end for
 
-        return out
-
 
 # optimize statement
 class OStatement(Statement):
 
+    __slots__ = ()
+
+    def str(self,t):
+        return t.underscores + OPTIMIZE + "({}) :- {}.\n".format(ast2str(self.name),body2str(self.body))
+
 
-    def str(self):
-        return Statement.underscores + OPTIMIZE + "({}) :- {}.\n".format(ast2str(self.name),body2str(self.body))
+    def translate(self,t):
+        yield self.str(t)
 
 
 # preference element
-class Element:
+class Element(object):
 
+    __slots__ = ("vars","preds","names","body","sets","cond","all_vars")
 
     def __init__(self):
         self.vars  = set()
@@ -209,8 +247,9 @@ class AstException(Exception):
 
 
 # weighted body
-class WBody:
+class WBody(object):
 
+    __slots__ = ("weight","body","naming","bf","ext_atoms_in_bf","analyzed")
 
     def __init__(self,weight,body,naming=False):
         self.weight             = weight
@@ -223,11 +262,11 @@ class WBody:
 
 
 
-    def __translate_ext_atom(self,atom):
+    def __translate_ext_atom(self,atom,u):
         if atom[0] == "true":
-            return ATOM+"("+Statement.underscores+TRUE+")", Statement.underscores+TRUE
+            return ATOM+"("+u+TRUE+")", u+TRUE
         elif atom[0] == "false":
-            return ATOM+"("+Statement.underscores+FALSE+")", Statement.underscores+FALSE
+            return ATOM+"("+u+FALSE+")", u+FALSE
         elif atom[0] == "atom":
             return ATOM+"("+ast2str(atom[1])+")", ast2str(atom[1])
         elif atom[0] == "cmp":
@@ -236,35 +275,35 @@ class WBody:
             raise AstException
 
 
-    def __bf2str(self,bf):
+    def __bf2str(self,bf,u):
         if bf[0] == "ext_atom":
-            atom_reified, atom = self.__translate_ext_atom(bf[1])
+            atom_reified, atom = self.__translate_ext_atom(bf[1],u)
             self.ext_atoms_in_bf.add((atom_reified,atom))  # fills self.ext_atoms_in_bf
             return atom_reified
         if bf[0]=="neg":
-            return NEG+"("  + self.__bf2str(bf[1][0]) + ")"
+            return NEG+"("  + self.__bf2str(bf[1][0],u) + ")"
         if bf[0]=="and":
-            return AND+"("  + self.__bf2str(bf[1][0]) + "," + self.__bf2str(bf[1][1]) + ")"
+            return AND+"("  + self.__bf2str(bf[1][0],u) + "," + self.__bf2str(bf[1][1],u) + ")"
         if bf[0]=="or":
-            return OR+"("   + self.__bf2str(bf[1][0]) + "," + self.__bf2str(bf[1][1]) + ")"
+            return OR+"("   + self.__bf2str(bf[1][0],u) + "," + self.__bf2str(bf[1][1],u) + ")"
 
 
-    def __translate_lit(self,lit):
+    def __translate_lit(self,lit,u):
         neg  = 0
         while lit[0]=="neg" and neg<=1:
             neg += 1
             lit  = lit[1][0]
         if lit[0]=="ext_atom":
-            atom_reified, atom = self.__translate_ext_atom(lit[1])
+            atom_reified, atom = self.__translate_ext_atom(lit[1],u)
             return ("lit",(neg*(NEG+"("))+atom_reified+(neg*")"),(neg*(NOT+" "))+atom)
         return None
 
 
-    def __translate_bf(self,bf):
-        out = self.__translate_lit(bf)
+    def __translate_bf(self,bf,u):
+        out = self.__translate_lit(bf,u)
         if out is not None: return out
-        string = self.__bf2str(bf)              # fills self.ext_atoms_in_bf
-        return ("bf",string,Statement.underscores+SAT+"("+string+")")
+        string = self.__bf2str(bf,u)            # fills self.ext_atoms_in_bf
+        return ("bf",string,u+SAT+"("+string+")")
 
 
     #
@@ -277,10 +316,10 @@ class WBody:
     # it also fills self.ext_atoms_in_bf with the atoms appearing in the body
     # and     fills self.bf     with the reified version of the body
     #
-    def __analyze_body(self):
+    def __analyze_body(self,u):
         # translate body
         for i in range(len(self.body)):
-            self.body[i] = self.__translate_bf(self.body[i]) # fills self.ext_atoms_in_bf
+            self.body[i] = self.__translate_bf(self.body[i],u) # fills self.ext_atoms_in_bf
         # fill self.bf the
         self.bf  = "".join([AND+"("+x[1]+"," for x in self.body[:-1]])
         self.bf += self.body[-1][1]
@@ -299,38 +338,38 @@ class WBody:
 
 
     # return the body with for() or name()
-    def str_body(self):
+    def str_body(self,t):
         if self.naming: return NAME+"({})".format(ast2str(self.body))
-        if not self.analyzed: self.__analyze_body()
+        if not self.analyzed: self.__analyze_body(t.underscores)
         return FOR+"({})".format(self.bf)
 
 
     # return rules for holds/2
-    def str_holds(self,body):
+    def str_holds(self,t,body):
         if self.naming: return ""
-        if not self.analyzed: self.__analyze_body()
+        if not self.analyzed: self.__analyze_body(t.underscores)
         if body != "": body = ", " + body
-        return Statement.underscores + HOLDS + "(" + str(self.bf) + ",0) :- " + ", ".join([x[2] for x in self.body]) + body + ".\n"
+        return t.underscores + HOLDS + "(" + str(self.bf) + ",0) :- " + ", ".join([x[2] for x in self.body]) + body + ".\n"
 
 
     # return rules for bf/1 with the boolean formulas which are not literals
-    # sets PStatement.bfs to True when necessary
-    def str_bf(self,body):
+    # sets t.bfs to True when necessary
+    def str_bf(self,t,body):
         if self.naming: return ""
         if body != "": body = " :- " + body
-        bfs = [Statement.underscores + BF + "(" + x[1] + ")" + body + "." for x in self.body if x[0]=="bf"]
+        bfs = [t.underscores + BF + "(" + x[1] + ")" + body + "." for x in self.body if x[0]=="bf"]
         if bfs!=[]:
-            PStatement.bfs = True
+            t.bfs = True
             return "\n".join(bfs)+"\n"
         return ""
 
 
     # return rules for sat/1 with extended atoms appearing in (boolean formulas which are not literals)
-    def str_sat(self,body):
+    def str_sat(self,t,body):
         if self.naming:       return ""
         if len(self.ext_atoms_in_bf) == 0: return ""
         if body != "": body = ", " + body
-        return "\n".join([Statement.underscores + SAT + "(" + x[0] + ") :- " + x[1] + body + "." for x in self.ext_atoms_in_bf]) + "\n"
+        return "\n".join([t.underscores + SAT + "(" + x[0] + ") :- " + x[1] + body + "." for x in self.ext_atoms_in_bf]) + "\n"
 
 
     #
@@ -349,6 +388,7 @@ class WBody:
 
     # return the atoms in the body as a list of strings (called before str_ functions)
     def get_atoms(self):
+        if self.naming: return []
         out = []
         for i in self.body:
             out += self.__get_atoms_from_bf(i)
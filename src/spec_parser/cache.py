@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+import os
+import hashlib
+import cPickle as pickle
+
+
+# directory of the caches
+CACHE   = os.environ.get("ASPRIN_CACHE",os.path.join(os.path.expanduser("~"),".cache","asprin"))
+# files of the spec parser that determine the cached tables and statements
+SOURCES = ["spec_parser.py","spec_lexer.py","ast.py"]
+
+
+# return the md5 of SOURCES
+def get_sources_hash():
+    path, md5 = os.path.dirname(os.path.realpath(__file__)), hashlib.md5()
+    for i in SOURCES:
+        md5.update(open(os.path.join(path,i)).read())
+    return md5.hexdigest()[:12]
+
+
+# return the directory name in CACHE, or None if it can not be created
+def get_dir(name):
+    out = os.path.join(CACHE,name)
+    try:
+        if not os.path.isdir(out): os.makedirs(out)
+    except OSError: return None
+    return out
+
+
+#
+# Cache of pickled objects in a directory, with one file per key
+#   - files are written under a temporary name and renamed
+#   - the modification time of a file is updated when it is read,
+#     and the least recently used files are deleted when the cache exceeds size bytes
+#
+class Cache:
+
+    def __init__(self,name,size):
+        self.dir    = get_dir(name)
+        self.size   = size
+        self.hits   = 0
+        self.misses = 0
+
+    def get(self,key):
+        if self.dir is not None:
+            path = os.path.join(self.dir,key)
+            try:
+                with open(path,"rb") as f: out = pickle.load(f)
+                os.utime(path,None)
+                self.hits += 1
+                return out
+            except Exception: pass
+        self.misses += 1
+        return None
+
+    def put(self,key,value):
+        if self.dir is None: return
+        path = os.path.join(self.dir,key)
+        tmp  = path + "." + str(os.getpid())
+        try:
+            with open(tmp,"wb") as f: pickle.dump(value,f,pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp,path)
+        except Exception: return
+        self.evict()
+
+    # deletes the least recently used files until the cache has at most self.size bytes
+    def evict(self):
+        files = []
+        for i in os.listdir(self.dir):
+            try:
+                stat = os.stat(os.path.join(self.dir,i))
+                files.append((stat.st_mtime,stat.st_size,i))
+            except OSError: pass
+        total = sum([i[1] for i in files])
+        for mtime, size, i in sorted(files):
+            if total <= self.size: break
+            try:    os.remove(os.path.join(self.dir,i))
+            except OSError: pass
+            total -= size
@@ -303,11 +303,6 @@ class Lexer:
     # you are doing
     # ------------------------------------------------------------
     def token(self):
-        t = self.mytoken()
-        print "+++" + str(t)
-        return t
-
-    def mytoken(self):
         # Make local copies of frequently referenced attributes
         lexpos    = self.lexpos
         lexlen    = self.lexlen
@@ -417,6 +412,12 @@ class Lexer:
             raise RuntimeError('No input string given with input()')
         return None
 
+    # token() printing every token, used instead of token() when tracing
+    def tracetoken(self):
+        t = Lexer.token(self)
+        print "+++" + str(t)
+        return t
+
     # Iterator interface
     def __iter__(self):
         return self
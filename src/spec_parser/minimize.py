@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import re
+import ast
+
+
+#
+# Translation of cardinality and weight preferences into #minimize statements
+#
+# It applies when the only optimized statement is either
+#   - a preference statement of a type in ELEMENTS, or
+#   - a lexico statement whose elements are weighted naming atoms of such statements,
+# and none of those statements has a body.
+# Statements of types in ELEMENTS have level 0,
+# and those named in a lexico statement have the level given by their weight,
+# which must be different for each of them.
+#
+
+# #minimize elements for each type, P is the name of the statement and L its level
+ELEMENTS = {
+    "less_cardinality" : "1@{L},{P},X : {u}holds(X,0), {u}preference({P},_,_,for(X),_)",
+    "more_cardinality" : "-1@{L},{P},X : {u}holds(X,0), {u}preference({P},_,_,for(X),_)",
+    "less_weight"      : "W@{L},{P},T : {u}holds(X,0), {u}preference({P},_,_,for(X),T), W = @head(T)",
+    "more_weight"      : "-W@{L},{P},T : {u}holds(X,0), {u}preference({P},_,_,for(X),T), W = @head(T)",
+}
+CARDINALITY = set(["less_cardinality","more_cardinality"])
+LEXICO      = "lexico"
+
+
+def has_var(string):
+    return re.search(r"(^|[^A-Za-z0-9_'])_*[A-Z]",string) is not None
+
+
+# return the statement with the given name, or None if it is not unique or has a body
+def get_statement(name,statements):
+    s = statements.get(name,[])
+    if len(s) != 1 or s[0].body is not None or has_var(name): return None
+    return s[0]
+
+
+def is_basic(s):
+    type = ast.ast2str(s.type)
+    if type not in ELEMENTS: return False
+    for e in s.elements:
+        if e.cond != [] or len(e.sets) != 1: return False
+        for w in e.sets[0]:
+            if w.naming: return False
+            if type in CARDINALITY and w.weight is not None: return False
+    return True
+
+
+# return a list of pairs (statement,level), or None
+# (or None if two statements have the same level, since #minimize would add their weights)
+def get_levels(s,statements):
+    if is_basic(s): return [(s,"0")]
+    if ast.ast2str(s.type) != LEXICO: return None
+    out, levels = [], set()
+    for e in s.elements:
+        if e.cond != [] or e.body is not None or len(e.sets) != 1 or len(e.sets[0]) != 1:
+            return None
+        w = e.sets[0][0]
+        level = ast.ast2str(w.weight) if w.weight is not None else ""
+        if not w.naming or not re.match(r"^-?[0-9]+$",level) or int(level) in levels: return None
+        levels.add(int(level))
+        child = get_statement(ast.ast2str(w.body),statements)
+        if child is None or not is_basic(child): return None
+        out.append((child,level))
+    return out
+
+
+# return the dictionary of preference statements by name, and the list of optimize statements
+def get_statements(items):
+    statements, optimize = {}, []
+    for i in items:
+        if i[0] == "PREFERENCE": statements.setdefault(ast.ast2str(i[1].name),[]).append(i[1])
+        if i[0] == "OPTIMIZE":   optimize.append(i[1])
+    return statements, optimize
+
+
+# return the optimized statement, or None if it is not unique or has a body
+def get_optimized(items):
+    statements, optimize = get_statements(items)
+    if len(optimize) != 1 or optimize[0].body is not None: return None, statements
+    return get_statement(ast.ast2str(optimize[0].name),statements), statements
+
+
+#
+# Input:  list of pairs (type,statement) of the spec_parser, and the underscores
+# Output: string with the #minimize statements, or None if the translation does not apply
+#
+def translate(items,underscores):
+    s, statements = get_optimized(items)
+    if s is None: return None
+    levels = get_levels(s,statements)
+    if levels is None: return None
+    out = "\n#program base.\n"
+    for s, level in levels:
+        element = ELEMENTS[ast.ast2str(s.type)].format(L=level,P=ast.ast2str(s.name),u=underscores)
+        out += "#minimize {{ {} }}.\n".format(element)
+    return out
+
+
+#
+# Subset and superset statements for the core method
+#
+
+CORE_TYPES = set(["subset","superset"])
+
+#
+# Input:  list of pairs (type,statement) of the spec_parser
+# Output: pair (name,type) of the optimized statement,
+#         or None if it is not a subset or superset statement without body, weights and naming atoms
+#
+def get_core(items):
+    s, statements = get_optimized(items)
+    if s is None or ast.ast2str(s.type) not in CORE_TYPES: return None
+    for e in s.elements:
+        if e.cond != [] or len(e.sets) != 1: return None
+        for w in e.sets[0]:
+            if w.naming or w.weight is not None: return None
+    return ast.ast2str(s.name), ast.ast2str(s.type)
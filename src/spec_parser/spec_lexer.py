@@ -1,6 +1,8 @@
 #!/usr/bin/python
 
 import lex
+import os
+import imp
 
 # logging
 import logging
@@ -18,17 +20,33 @@ class LexIlegalCharacterException(LexError):
     def __str__(self):
         return "Lexer: Illegal character " + repr(self.value)
 
+# name of the lexer table module
+LEXTAB = "asprin_lextab"
+
 #
 # Lexer
 #
 class Lexer(object):
 
-    def __init__(self):
-        self.lexer = lex.lex(module=self)
+    # tables is the directory of the lexer table, or None to build the lexer from the rules
+    def __init__(self,tables=None):
+        if tables is None: self.lexer = lex.lex(module=self)
+        else:              self.lexer = self.__lex_tables(tables)
         self.lexer.push_state('normal')
         self.code_start = 0
         self.underscores = 0
 
+    # reads the lexer table, or writes it under a temporary name and renames it
+    def __lex_tables(self,tables):
+        path = os.path.join(tables,LEXTAB + ".py")
+        if os.path.exists(path):
+            return lex.lex(module=self,optimize=True,lextab=imp.load_source(LEXTAB,path))
+        tmp = LEXTAB + str(os.getpid())
+        lexer = lex.lex(module=self,optimize=True,lextab=tmp,outputdir=tables)
+        try:    os.rename(os.path.join(tables,tmp + ".py"),path)
+        except OSError: pass
+        return lexer
+
     def reset(self):
         while self.lexer.lexstate != 'normal':
             self.lexer.pop_state()
@@ -261,10 +279,12 @@ class Lexer(object):
 
     #
     # normal state: pass through characters
-    #               until string or change of state (above)
+    #               until string, identifier starting with underscores, or change of state (above)
+    #   runs of other characters and whole words are skipped at once,
+    #   leaving the last character for the eof rule
     #
     def t_normal_ANY(self,t):
-        r'[\000-\377]'
+        r'(?:[^"_%\#A-Za-z0-9\']|[A-Za-z0-9\'][A-Za-z0-9_\']*(?![A-Za-z0-9_\']))+(?!\Z)|[\000-\377]'
         pass
 
     # never reachable token (to avoid warning)
@@ -289,7 +309,7 @@ class Lexer(object):
         t.lexer.push_state('comment')
 
     def t_blockcomment_ANY(self,t):
-        r'[\000-\377]'
+        r'[^%*]+(?!\Z)|[\000-\377]'
         pass
 
     #
@@ -300,7 +320,7 @@ class Lexer(object):
         t.lexer.pop_state()
 
     def t_comment_ANY(self,t):
-        r'[\000-\377]'
+        r'[^\n]+(?!\Z)|[\000-\377]'
         pass
 
     #
@@ -311,7 +331,7 @@ class Lexer(object):
         t.lexer.pop_state()
 
     def t_script_ANY(self,t):
-        r'[\000-\377]'
+        r'[^\#]+(?!\Z)|[\000-\377]'
         pass
 
     #
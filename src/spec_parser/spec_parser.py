@@ -1,9 +1,15 @@
 #!/usr/bin/python
 
 import sys
+import re
+import os
+import hashlib
+import multiprocessing
 import yacc
 from spec_lexer import Lexer
 import ast
+import minimize
+import cache
 
 # logging
 import logging
@@ -15,6 +21,36 @@ import logging
 class ParseError(Exception):
     pass
 
+# files without these are not parsed
+PREFERENCE_SYNTAX = re.compile(r"\#(preference|optimize)")
+# comments, strings and scripts, or identifiers starting with underscores (group 1)
+UNDERSCORES       = re.compile(r"""%\*.*?\*%|%[^\n]*|"(?:[^"\\\n]|\\.)*"|\#script.*?\#end|(?<![A-Za-z0-9_'])(_+)[a-z]""",re.S)
+
+# #program statements at the beginning of a line, with the type (group 1) of preference(<type>)
+PROGRAM           = re.compile(r"^\#program[ \t]+(?:preference[ \t]*\([ \t]*([a-z_'A-Za-z0-9]+)[ \t]*\)[ \t]*\.)?",re.M)
+
+# cached lexer and parser tables, and parsed statements
+PARSETAB          = "parsetab.pickle"
+STATEMENTS        = "statements"
+CACHE_SIZE        = 64*1024*1024 # bytes
+
+#
+# Input:  nothing
+# Output: directory of the tables for this grammar and PLY version, or None if it can not be created
+#
+def get_table_dir():
+    return cache.get_dir("tables-" + yacc.__version__ + "-" + cache.get_sources_hash())
+
+#
+# Parallel parsing: every worker process parses with its own Parser
+#
+worker_parser = None
+
+def parse_items(code):
+    global worker_parser
+    if worker_parser is None: worker_parser = Parser(statements=False)
+    return worker_parser.parse_items(code)
+
 #
 #
 # Ply Preference Specification Parser
@@ -23,37 +59,164 @@ class ParseError(Exception):
 
 class Parser(object):
 
-    def __init__(self):
+    # if trace is True, the tokens and the parser actions are printed
+    # if tables is True, the lexer and parser tables are read from (or written to) get_table_dir()
+    # if statements is True, the statements parsed from every file are cached by the md5 of the file
+    # if processes > 1, several files with preference statements are parsed in a pool of processes
+    # if library is a file, its #program preference(<type>) blocks are only kept if <type> is used
+    def __init__(self,trace=False,tables=True,statements=True,processes=1,library=None):
         # start famework
-        self.lexer = Lexer()
+        tables = get_table_dir() if tables else None
+        self.lexer = Lexer(tables)
         self.tokens = self.lexer.tokens
-        self.parser = yacc.yacc(module=self)
-        self.log = logging.getLogger()
+        if tables is None: self.parser = yacc.yacc(module=self)
+        else:              self.parser = self.__yacc_tables(tables)
+        self.debug = yacc.PlyLogger(sys.stderr) if trace else False
+        if trace: self.lexer.lexer.token = self.lexer.lexer.tracetoken
         # semantics
+        self.reset()
+        # cache
+        self.cache = None
+        if statements: self.cache = cache.Cache(STATEMENTS + "-" + cache.get_sources_hash(),CACHE_SIZE)
+        # parallel parsing
+        self.processes = processes
+        # library of preference types
+        self.library = os.path.realpath(library) if library is not None else None
+
+    # resets the state of the last parse, so that the parser can be used again
+    def reset(self):
         self.p_statements = 0
         self.list = []
+        self.element = ast.Element()
+        self.lexer.underscores = 0
+        self.lexer.reset()
+
+    # reads the pickled parser tables, or writes them under a temporary name and renames them
+    def __yacc_tables(self, tables):
+        path = os.path.join(tables,PARSETAB)
+        if os.path.exists(path):
+            return yacc.yacc(module=self,optimize=True,debug=False,picklefile=path)
+        tmp = path + str(os.getpid())
+        parser = yacc.yacc(module=self,optimize=True,debug=False,picklefile=tmp)
+        try:    os.rename(tmp,path)
+        except OSError: pass
+        return parser
 
     def __parse_str(self, pref):
         self.element = ast.Element()
-        self.parser.parse(pref, self.lexer.lexer, debug=self.log) # parses into self.list
+        self.parser.parse(pref, self.lexer.lexer, debug=self.debug) # parses into self.list
         self.lexer.reset()
 
+    # passes code without preference statements through,
+    # counting the underscores of identifiers outside comments, strings and scripts
+    # (nested block comments are not handled, what may only add underscores)
+    def __scan_str(self, code):
+        self.list.append(("CODE",code))
+        underscores = max([len(i) for i in UNDERSCORES.findall(code)] + [0])
+        if underscores > self.lexer.underscores: self.lexer.underscores = underscores
+
+    #
+    # Input:  string
+    # Output: pair (items,underscores) with the list of items and the underscores of the string,
+    #         leaving the state of the parser unchanged
+    #
+    def parse_items(self, code):
+        state = self.list, self.p_statements, self.lexer.underscores
+        self.list, self.p_statements, self.lexer.underscores = [], 0, 0
+        self.__parse_str(code)
+        out = self.list, self.lexer.underscores
+        self.list, self.p_statements, self.lexer.underscores = state
+        return out
+
+    # adds items, numbering again their statements, so that the numbers do not depend on where they were parsed
+    def __add_items(self, items, underscores):
+        for i in items:
+            if i[0] == "PREFERENCE":
+                self.p_statements += 1
+                i[1].number = self.p_statements
+        self.list += items
+        if underscores > self.lexer.underscores: self.lexer.underscores = underscores
+
+    # return for every code None if it has no preference statements, or its pair (items,underscores)
+    # read from the cache, or parsed in a pool of self.processes processes if there are several to parse
+    def __parse_codes(self, codes):
+        out, keys, todo = [None for i in codes], [None for i in codes], []
+        for i, code in enumerate(codes):
+            if PREFERENCE_SYNTAX.search(code) is None: continue
+            if self.cache is not None:
+                keys[i] = hashlib.md5(code).hexdigest()
+                out[i]  = self.cache.get(keys[i])
+            if out[i] is None: todo.append(i)
+        if self.processes > 1 and len(todo) > 1:
+            pool = multiprocessing.Pool(min(self.processes,len(todo)))
+            try:     results = pool.map(parse_items,[codes[i] for i in todo])
+            finally: pool.terminate()
+        else:
+            results = [self.parse_items(codes[i]) for i in todo]
+        for i, result in zip(todo,results):
+            out[i] = result
+            if self.cache is not None: self.cache.put(keys[i],result)
+        return out
+
+    # yields the translation of every item
+    def __translate_list(self):
+        t = ast.Translation(self.get_underscores())
+        for i in self.list:
+            if i[0] == "CODE": yield i[1]
+            else:
+                for j in i[1].translate(t): yield j
+        if t.bfs:
+            yield ast.bf_encoding.replace("_",t.underscores)
+
     def __print_list(self):
-        ast.Statement.underscores = self.get_underscores()
-        out = ""
+        return "".join(self.__translate_list())
+
+    # return the set of types of the preference statements, or None if some type has variables
+    def __get_types(self):
+        out = set()
         for i in self.list:
-            if i[0] == "CODE":       out += i[1]
-            if i[0] == "PREFERENCE": out += i[1].str()
-            if i[0] == "OPTIMIZE":   out += i[1].str()
-        if ast.PStatement.bfs:
-            out += ast.bf_encoding.replace("_",ast.Statement.underscores)
+            if i[0] == "PREFERENCE":
+                type = ast.ast2str(i[1].type)
+                if minimize.has_var(type): return None
+                out.add(type)
         return out
 
+    # removes from code the #program preference(<type>) blocks whose type is not in types
+    def __filter_library(self, code, types):
+        starts = [m.start() for m in PROGRAM.finditer(code)] + [len(code)]
+        out = [code[:starts[0]]]
+        for start, end in zip(starts,starts[1:]):
+            type = PROGRAM.match(code,start).group(1)
+            if type is None or type in types: out.append(code[start:end])
+        return "".join(out)
+
+    # the blocks of self.library are filtered by the types of all preference statements,
+    # what includes the children of composite types (lexico, pareto, and, neg)
+    def __parse_files(self,files):
+        self.reset()
+        codes, library = [open(i).read() for i in files], []
+        for file, code, items in zip(files,codes,self.__parse_codes(codes)):
+            if self.list != []: self.list.append(("CODE","\n#program base.\n"))
+            if items is None:
+                if os.path.realpath(file) == self.library: library.append(len(self.list))
+                self.__scan_str(code)
+            else:
+                self.__add_items(*items)
+        types = self.__get_types()
+        if types is None: return
+        for i in library:
+            self.list[i] = ("CODE",self.__filter_library(self.list[i][1],types))
+
+    #
+    # Every parse_ and write_ function starts a new parse (see reset())
+    #
+
     #
     # Input:  string
     # Output: string with the translation
     #
     def parse_str(self,str):
+        self.reset()
         self.__parse_str(str)
         return self.__print_list()
 
@@ -62,15 +225,34 @@ class Parser(object):
     # Output: string with the translation
     #
     def parse_files(self,files):
-        for i in files:
-            if self.list != []: self.list.append(("CODE","\n#program base.\n"))
-            self.__parse_str(open(i).read())
+        self.__parse_files(files)
         return self.__print_list()
 
+    #
+    # Input:  list of files, and an object with a write() method (e.g., a file or a pipe)
+    # Output: writes the translation to out
+    #
+    def write_files(self,files,out):
+        self.__parse_files(files)
+        for i in self.__translate_list(): out.write(i)
+
+    # return the pair (hits,misses) of the cache of statements
+    def get_cache_statistics(self):
+        if self.cache is None: return 0, 0
+        return self.cache.hits, self.cache.misses
+
     # return the underscores needed
     def get_underscores(self):
         return "_" + ("_" * self.lexer.underscores)
 
+    # return #minimize statements for the preference specification, or None if not possible
+    def get_minimize(self):
+        return minimize.translate(self.list,self.get_underscores())
+
+    # return (name,type) of the optimized subset or superset statement, or None if there is none
+    def get_core(self):
+        return minimize.get_core(self.list)
+
 
     #
     # Syntax:
@@ -201,6 +383,7 @@ class Parser(object):
         """
         p[0] = p[1:]
         if len(p)>=4 and p[0][1]==",": p[0][1]=", "
+        p[0] = tuple(p[0])
 
     #
     # PREFERENCE ELEMENTS
@@ -215,7 +398,8 @@ class Parser(object):
             self.element.sets = p[3][0]
             self.element.cond = p[3][1]
             self.element.body = p[4]
-            p[0] = p[1] + [self.element]
+            p[1].append(self.element)
+            p[0] = p[1]
         else:
             self.element.sets = p[1][0]
             self.element.cond = p[1][1]
@@ -240,7 +424,8 @@ class Parser(object):
                       |                weighted_body_set
         """
         if len(p) == 4:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
             p[0] = [p[1]]
 
@@ -258,7 +443,8 @@ class Parser(object):
                               |                       weighted_body
         """
         if len(p) == 4:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
             p[0] = [p[1]]
 
@@ -311,7 +497,7 @@ class Parser(object):
         """ naming_atom : identifier
                         | identifier LPAREN argvec RPAREN
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
         self.element.names.append(p[0])
 
     #
@@ -323,13 +509,13 @@ class Parser(object):
                        | na_ntermvec
                        | atomvec COMMA na_ntermvec
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_atomvec(self,p):
         """ atomvec : atom
                     | atomvec COMMA atom
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
         if len(p)==4:
             self.atomvec.append(("ext_atom",["atom",p[3]]))
         else:
@@ -339,7 +525,7 @@ class Parser(object):
         """ na_ntermvec : na_term
                         | na_term COMMA ntermvec
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     #
     #   """ bfvec_x : atomvec
@@ -378,7 +564,8 @@ class Parser(object):
                      |             bformula
         """
         if len(p)==4:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
             p[0] = [p[1]]
 
@@ -507,7 +694,7 @@ class Parser(object):
                     | many_minus SUB identifier LPAREN argvec RPAREN %prec UMINUS
                     | many_minus SUB identifier
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_na_term_more(self,p):
         """ na_term_more : BNOT term %prec UBNOT
@@ -521,13 +708,13 @@ class Parser(object):
                          | variable
                          | ANONYMOUS
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_many_minus(self,p):
         """many_minus : SUB
                       | many_minus SUB %prec UMINUS
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
 
     #
@@ -586,7 +773,7 @@ class Parser(object):
     def p_variable(self,p):
         """ variable : VARIABLE
         """
-        p[0] = p[1]
+        p[0] = intern(p[1])
         self.element.all_vars.add(p[1])
 
     #
@@ -618,25 +805,25 @@ class Parser(object):
                  | variable
                  | ANONYMOUS
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_unaryargvec(self,p):
         """ unaryargvec :  term
                         |  unaryargvec SEM term
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_ntermvec(self,p):
         """ ntermvec : term
                      | ntermvec COMMA term
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_termvec(self,p):
         """ termvec : ntermvec
                     |
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_tuple(self,p):
         """ tuple : ntermvec COMMA
@@ -644,25 +831,25 @@ class Parser(object):
                   |          COMMA
                   |
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_tuplevec_sem(self,p):
         """ tuplevec_sem :              tuple SEM
                          | tuplevec_sem tuple SEM
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_tuplevec(self,p):
         """ tuplevec :              tuple
                      | tuplevec_sem tuple
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_argvec(self,p):
         """ argvec :            termvec
                    | argvec SEM termvec
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_cmp(self,p):
         """ cmp :  GT
@@ -680,7 +867,7 @@ class Parser(object):
                  | SUB identifier
                  | SUB identifier LPAREN argvec RPAREN
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
         self.element.preds.append(p[0])
 
     def p_csp_mul_term(self,p):
@@ -689,14 +876,14 @@ class Parser(object):
                          |              CSP term
                          |                  term
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_csp_add_term(self,p):
         """ csp_add_term : csp_add_term CSP_ADD csp_mul_term
                          | csp_add_term CSP_SUB csp_mul_term
                          |                      csp_mul_term
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_csp_rel(self,p):
         """ csp_rel : CSP_GT
@@ -712,12 +899,12 @@ class Parser(object):
         """ csp_literal : csp_literal   csp_rel csp_add_term
                         | csp_add_term  csp_rel csp_add_term
         """
-        p[0] = p[1:]
+        p[0] = tuple(p[1:])
 
     def p_identifier(self,p):
         """ identifier : IDENTIFIER
         """
-        p[0] = p[1]
+        p[0] = intern(p[1])
 
 
     #
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+import os
+import sys
+import subprocess
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)),"..")
+try:
+    import clingo
+except ImportError:
+    clingo = None
+
+# options of every mode, compared with --method=basic
+MODES = [
+    ["--method=minimize"],
+    ["--method=core"],
+    ["--ground-once"],
+    ["--slots=2"],
+    ["--compaction=1"],
+    ["--inject=backend"],
+    ["--inject=callback"],
+    ["--processes=2"],
+    ["--portfolio=2"],
+    ["--heuristic"],
+]
+
+EXAMPLES = [["examples/example1.lp","asprin.lib"]]
+
+
+# return the set of optimal models printed by asprin,
+# each one as the set of its atoms whose predicate is in preds
+# (with the projection on the preference atoms, the other atoms of a model may differ)
+def optimal_models(options,files,preds):
+    out = subprocess.check_output([sys.executable,"asprin.py","0"] + options + files,cwd=ROOT)
+    lines, models = out.splitlines(), set()
+    for i in range(len(lines)-2):
+        if lines[i].strip() == "Answer:" and lines[i+2].strip() == "OPTIMUM FOUND":
+            models.add(frozenset([x for x in lines[i+1].split() if x.split("(")[0] in preds]))
+    return models
+
+
+@unittest.skipIf(clingo is None,"clingo is not available")
+class TestModes(unittest.TestCase):
+
+    def test_modes(self):
+        for files in EXAMPLES:
+            basic = optimal_models(["--method=basic"],files,["a"])
+            self.assertNotEqual(basic,set())
+            for options in MODES:
+                self.assertEqual(optimal_models(options,files,["a"]),basic," ".join(options + files))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),".."))
+try:
+    import clingo
+    from src.pp_parser import pp_parser
+    from src.spec_parser import cache
+except ImportError:
+    clingo = None
+
+
+@unittest.skipIf(clingo is None,"clingo is not available")
+class TestProgramCache(unittest.TestCase):
+
+    def setUp(self):
+        self.old = cache.CACHE
+        cache.CACHE = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(cache.CACHE)
+        cache.CACHE = self.old
+
+    # return the atoms of the model of the chunks, grounding base, and foo(1) if foo is True
+    def model(self,chunks,foo=True,programs=True):
+        control = pp_parser.Parser("_",programs=programs).parse(chunks)
+        control.ground([("base",[])] + ([("foo",[clingo.Number(1)])] if foo else []))
+        out = []
+        control.solve(on_model=lambda m: out.extend([str(x) for x in m.symbols(shown=True)]))
+        return sorted(out)
+
+    # the second chunk is read from the cache and the others are parsed,
+    # and the chunks start and end in different programs
+    def test_hits_and_misses(self):
+        self.model(["#program foo(k).", "b(k).\n#program base.\nc."])
+        chunks = ["a.\n#program foo(k).", "b(k).\n#program base.\nc.", "d.\n#program foo(k).", "e(k)."]
+        self.assertEqual(self.model(chunks,False),["a","c","d"])
+        self.assertEqual(self.model(chunks),["a","b(1)","c","d","e(1)"])
+
+    def test_no_cache(self):
+        chunks = ["a.\n#program foo(k).", "b(k).\n#program base.\nc.", "d.\n#program foo(k).", "e(k)."]
+        self.assertEqual(self.model(chunks,False,False),["a","c","d"])
+        self.assertEqual(self.model(chunks,True,False),["a","b(1)","c","d","e(1)"])
+
+if __name__ == "__main__":
+    unittest.main()